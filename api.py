@@ -0,0 +1,471 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script provides the parser and the trainer as classes that other python programs can import.
+
+usage:
+	from api import Parser, Trainer
+	Trainer(workers=2).fit("train.conll06").save("english") # writes model-english
+	parser = Parser.load("english") # nothing is loaded until the first parse
+	for current_sentence in parser.parse(read_conll(open("test.conll06"), False)):
+		print current_sentence.heads
+
+Models are loaded on first use and kept in a cache keyed by the path of the model file, so every Parser of the
+same model shares one copy of it. The cache holds at most MODEL_CACHE_SIZE models, the least recently used one is
+dropped first. A model file that was saved again since it was loaded is loaded again.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import os
+import random
+import cPickle as pickle
+import threading
+from collections import OrderedDict
+import time
+import oracle
+from classes import *
+from instrumentation import Instrumentation
+from evaluate import attachment_score, get_heads
+
+'''
+******* ********* *********
+******* constants *********
+******* ********* *********
+'''
+MODEL_CACHE_SIZE = 4 # models kept loaded by get_model
+EXTRACT_SHARDS_PER_WORKER = 4 # sentence shards per extraction process, more shards even out their speed
+CHECKPOINT_VERSION = 1 # version of the checkpoints of Trainer.save_checkpoint, bump it whenever their content changes
+DEV_EVERY = 2 # the dev sentences are scored after every n-th epoch by default, patience counts these scores
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+# models loaded by get_model: absolute model path -> (modification time, Features), least recently used first
+model_cache = OrderedDict()
+model_cache_lock = threading.Lock() # the parse server looks up models from several threads
+# sentences and hash bits of the running Trainer.extract_parallel call, inherited by the forked extraction workers
+extract_job = None
+
+'''
+******* ********* *********
+*******  Classes  *********
+******* ********* *********
+'''
+
+class Parser:
+	'Parses sentences with a trained model, the model is loaded on first use and shared through the model cache'
+	def __init__(self, language, model_file = None):
+		self.language = language
+		self.model_file = model_file # None = model-<lang>, which falls back to the pickled model
+		self.guide = Guide()
+
+	@classmethod
+	def load(cls, language, model_file = None):
+		'''return a parser for the model of a language (model-<lang> unless another model file is given)'''
+		return cls(language, model_file)
+
+	def get_model(self):
+		'''method to return the Features of the model, loading it if it is not in the model cache'''
+		return get_model(self.language, self.model_file)
+
+	def parse(self, sentences, workers = 1, batch_size = 1, beam_size = 1, static_scores = False):
+		'''method to parse sentences from any iterable and yield them with their predicted heads in input order'''
+		return parse_stream(sentences, self.get_model(), self.guide, workers, batch_size, beam_size, static_scores)
+
+class Trainer:
+	'Trains the averaged perceptron of a parser model on CoNLL06 sentences'
+	def __init__(self, hash_bits = None, workers = 1, epochs = 10, seed = 333, log = None, instrumentation = None, extract_workers = 1, beam_size = 1, dev = None, patience = None, checkpoint_file = None, resume = False, dev_every = DEV_EVERY, dev_sample = None):
+		if beam_size > 1 and workers > 1:
+			raise ValueError("beam training runs in a single process, use workers = 1")
+		if resume and not checkpoint_file:
+			raise ValueError("resuming needs the checkpoint file of the interrupted run")
+		if dev_every < 1:
+			raise ValueError("the dev sentences are scored after every n-th epoch, n has to be at least 1")
+		self.hash_bits = hash_bits # bits of the hashed feature table (None = exact feature map)
+		self.workers = workers # more than 1 = iterative parameter mixing
+		self.beam_size = beam_size # more than 1 = early-update training of the beam decoder
+		self.extract_workers = extract_workers # processes that replay the oracle and extract the features
+		self.epochs = epochs # most epochs, fewer with early stopping
+		self.dev = dev # gold sentences (or the path of a gold file) to score the averaged weights on, None = no scoring
+		self.dev_every = dev_every # the dev sentences are scored after every n-th epoch and after the last one
+		self.dev_sample = dev_sample # number of dev sentences that are scored, None = all
+		self.patience = patience # dev scores without a better one before training stops, None = all epochs
+		self.seed = seed # seed of the shuffling of the instances
+		self.checkpoint_file = checkpoint_file # the training state is written to it after every epoch, None = no checkpoints
+		self.resume = resume # continue the run of the checkpoint file instead of starting from the first epoch
+		self.checkpoint_map = None # pickled feature map, the same in every checkpoint of a run
+		self.log = log # file for progress messages, None = quiet
+		self.instrumentation = instrumentation or Instrumentation(False) # records phases and epochs when enabled
+		self.feats = None
+		self.sentences = None # training sentences of the beam training
+		self.dev_sentences = None
+		self.dev_heads = None # gold heads of all dev tokens
+		self.dev_memo = None # feature vectors of the dev configurations of the last scoring
+		self.best = None # dev score, epoch and averaged weights of the best epoch so far
+
+	def report(self, message):
+		'''method to write a progress message to the log'''
+		if self.log is not None:
+			print >> self.log, message
+
+	def fit(self, sentences):
+		'''method to train a model on an iterable of Sentences or on the path of a CoNLL06 training file'''
+		self.feats = Features(self.hash_bits)
+		with self.instrumentation.phase("instances"):
+			if isinstance(sentences, basestring):
+				self.read_instances(sentences)
+			else:
+				if self.beam_size > 1: #the beam training goes over the sentences again
+					sentences = list(sentences)
+				self.extract_instances(sentences)
+			if self.beam_size > 1: #the feature map of the oracle transitions is the feature map of the beam training
+				self.sentences = read_sentences(sentences)
+		with self.instrumentation.phase("training"):
+			self.train()
+		return self
+
+	def update(self, sentences, language, model_file = None, replay = None):
+		'''method to continue training a saved model on new sentences (an iterable of Sentences or the path of a CoNLL06 file) and optionally on replayed old ones'''
+		# the feature map of the model grows with the features of the new sentences and the perceptron starts from
+		# the saved weights, so only the new (and replayed) instances are extracted and trained on
+		self.feats = Features()
+		with self.instrumentation.phase("load_model"):
+			self.feats.load_model(language, model_file)
+			self.feats.unfreeze()
+		initial_weights = self.feats.weights
+		with self.instrumentation.phase("instances"):
+			self.report("Reading new sentences, extracting features and creating instances...")
+			sentences = read_sentences(sentences)
+			if self.beam_size > 1: #the beam training goes over the sentences again
+				sentences = list(sentences) + list(replay or [])
+				replay = None
+				self.sentences = sentences
+			self.extract_instances(sentences)
+			if replay is not None:
+				self.extract_instances(replay)
+		with self.instrumentation.phase("training"):
+			self.train(initial_weights)
+		return self
+
+	def read_instances(self, source_file):
+		'''method to get the feature map and the instances of a training file from its cache or by extracting them'''
+		cache_file = source_file + ".instances" # binary cache of the feature map and instances
+		if self.feats.load_instances(cache_file, source_file):
+			self.report("Loaded feature map and instances from %s" %cache_file)
+			return
+		if self.extract_workers > 1:
+			self.report("Reading input data, extracting features and creating instances with %i processes..." %self.extract_workers)
+		else:
+			self.report("Reading input data, extracting features and creating instances...")
+		self.extract_instances(read_corpus(source_file))
+		self.report("Caching feature map and instances to %s" %cache_file)
+		self.feats.save_instances(cache_file, source_file)
+
+	def extract_instances(self, sentences):
+		'''method to build the feature map and the instances of the oracle transitions of sentences'''
+		if self.extract_workers > 1:
+			self.extract_parallel(sentences)
+			return
+		# sentences are read one at a time and dropped once their instances are extracted
+		for current_sentence in sentences:
+			current_state = State(len(current_sentence.forms)) # create a start state for the sentence
+			while current_state.queue:
+				tr = oracle.get_oracle_transition(current_state, current_sentence) #get correct transition
+				fvector = self.feats.extract_features(current_state, current_sentence) # extract featuress
+				self.feats.instances.append(tr.transition, fvector) # create instance
+				current_state = tr.apply_transition(current_state) #create new state
+
+	def extract_parallel(self, sentences):
+		'''method to extract the instances of sentences with a pool of processes and merge them into the feature map'''
+		# the workers replay the oracle on contiguous shards of the sentences, each with a feature map of its own,
+		# and send back the feature strings of their map and their instances. The shards are merged in input
+		# order and update_map hands out the rows of a shard's new features in the order the shard saw them
+		# first, so the feature map and the instances are the same as those of the serial extraction.
+		global extract_job
+		feats = self.feats
+		sentences = list(sentences) # inherited by the forked workers
+		n_shards = min(len(sentences), EXTRACT_SHARDS_PER_WORKER * self.extract_workers)
+		bounds = [len(sentences) * shard // max(n_shards, 1) for shard in range(n_shards + 1)]
+		instances = feats.instances.freeze()
+		transitions = [instances.transitions]
+		offsets = [instances.offsets]
+		features = [instances.features]
+		extract_job = (sentences, self.hash_bits)
+		pool = multiprocessing.Pool(self.extract_workers)
+		try:
+			for shard_features, shard_transitions, shard_offsets, shard_rows in pool.imap(extract_shard, zip(bounds[:-1], bounds[1:])):
+				if shard_features is not None: #turn the rows of the shard's map into rows of the global map
+					remap = np.array([feats.update_map(feature) for feature in shard_features.split("\n")], dtype=np.int32)
+					shard_rows = remap[shard_rows]
+				transitions.append(shard_transitions)
+				offsets.append(shard_offsets[1:] + offsets[-1][-1])
+				features.append(shard_rows)
+		finally:
+			pool.terminate()
+			pool.join()
+			extract_job = None
+		feats.instances = InstanceStore(np.concatenate(transitions), np.concatenate(offsets), np.concatenate(features))
+
+	def train(self, initial_weights = None):
+		'''method to train the averaged weights on the extracted instances, starting from zero or from initial weights'''
+		feats = self.feats
+		feats.freeze() #freeze feature map, the compiled keys of the extraction are dropped
+		instances = feats.instances.freeze()
+		order = np.arange(len(instances), dtype=np.int32) #the instances are visited in this order, shuffling it leaves the store as it is
+		random.seed(self.seed)
+		if self.dev is not None: #the views of the dev sentences keep their lists from one epoch to the next
+			self.dev_sentences = list(read_sentences(self.dev))
+			if self.dev_sample and self.dev_sample < len(self.dev_sentences): #the same sample in every epoch, in file order
+				sample = random.Random(self.seed).sample(range(len(self.dev_sentences)), self.dev_sample)
+				self.dev_sentences = [self.dev_sentences[index] for index in sorted(sample)]
+			self.dev_heads = get_heads(self.dev_sentences, True)
+			self.dev_memo = ParseMemo(len(self.dev_sentences))
+			self.best = None
+
+		checkpoint = self.load_checkpoint() if self.resume else None
+
+		if self.beam_size > 1:
+			self.report("Offline training: %i epochs of early-update training with a beam of %i..." %(self.epochs, self.beam_size))
+			feats.weights = self.train_beam(initial_weights, checkpoint)
+			return
+
+		if self.workers > 1:
+			self.report("Offline training: %i epochs of iterative parameter mixing over %i processes..." %(self.epochs, self.workers))
+			def end_epoch(k, mixed_weights, weight_sum):
+				stop = self.is_dev_epoch(k) and self.end_epoch(k, weight_sum * (1.0 / ((k + 1) * len(order))))
+				self.save_checkpoint(k, {"mixed_weights": mixed_weights, "weight_sum": weight_sum, "order": order}, stop)
+				return stop
+			resume = None
+			epochs = self.epochs
+			if checkpoint is not None: #continue where the interrupted run left off
+				state = checkpoint["state"]
+				order[:] = state["order"]
+				resume = (checkpoint["epoch"] + 1, state["mixed_weights"], state["weight_sum"])
+				if checkpoint["stopped"]:
+					epochs = resume[0]
+			feats.weights = train_mixed(instances, feats.next_index, self.workers, epochs, order, self.instrumentation, initial_weights, end_epoch, resume)
+			if self.best is not None:
+				feats.weights = self.get_best_weights()
+			return
+
+		self.report("Offline training: creating zero weight matrices...")
+		perceptron = self.get_perceptron(initial_weights)
+
+		self.report("Offline training: looping over instances...")
+		feats.weights = self.run_epochs(perceptron, order, lambda order: perceptron.train_epoch(instances, order), checkpoint)
+
+	def train_beam(self, initial_weights = None, checkpoint = None):
+		'''method to train the averaged weights with early updates of the beam decoder on the training sentences'''
+		# the feature map stays frozen, features of configurations the oracle never reaches are only scored if the
+		# map has them, just like at parse time
+		feats = self.feats
+		sentences = self.sentences
+		gold_transitions = [get_gold_transitions(current_sentence) for current_sentence in sentences]
+		order = range(len(sentences)) #the sentences are visited in this order
+		perceptron = self.get_perceptron(initial_weights)
+		train_epoch = lambda order: perceptron.train_beam_epoch(sentences, gold_transitions, order, feats, self.beam_size)
+		return self.run_epochs(perceptron, order, train_epoch, checkpoint)
+
+	def get_perceptron(self, initial_weights = None):
+		'''method to create the perceptron of the feature map, with zero weights or with the weights of a saved model'''
+		perceptron = Perceptron(self.feats.next_index) #create zero weight matrices of size n * 4, where n is the length of the feature map
+		if initial_weights is not None: #rows of features that are new to the model start at zero
+			perceptron.weights[:len(initial_weights)] += initial_weights
+		return perceptron
+
+	def run_epochs(self, perceptron, order, train_epoch, checkpoint = None):
+		'''method to run the epochs of a perceptron with dev scoring and checkpoints and return the averaged weights'''
+		first_epoch = 0
+		stopped = False
+		if checkpoint is not None: #continue where the interrupted run left off
+			state = checkpoint["state"]
+			perceptron.weights[:] = state["weights"]
+			perceptron.cache_weights[:] = state["cache_weights"]
+			perceptron.steps = state["steps"]
+			order[:] = state["order"]
+			first_epoch = checkpoint["epoch"] + 1
+			stopped = checkpoint["stopped"]
+		for k in range(first_epoch, first_epoch if stopped else self.epochs):
+			self.report("epoch: %i started..." %k)
+			start = time.time()
+			if k > 0:
+				random.shuffle(order)
+			mistakes = train_epoch(order) #loop over instances
+			self.instrumentation.record_epoch(k, time.time() - start, len(order), mistakes)
+			stop = self.is_dev_epoch(k) and self.end_epoch(k, perceptron.get_averaged())
+			self.save_checkpoint(k, {"weights": perceptron.weights, "cache_weights": perceptron.cache_weights, "steps": perceptron.steps, "order": order}, stop)
+			if stop:
+				break
+
+		if self.best is not None:
+			return self.get_best_weights()
+		self.report("Averaging weights...")
+		#average weights in place, no copies of the model are made
+		return perceptron.average()
+
+	def get_settings(self):
+		'''method to return the settings of the run that a checkpoint has to match to be resumed'''
+		dev = self.dev if self.dev is None or isinstance(self.dev, basestring) else "sentences"
+		return {"feature_version": FEATURE_VERSION, "hash_bits": self.hash_bits, "workers": self.workers, "beam_size": self.beam_size,
+			"seed": self.seed, "dev": dev, "dev_every": self.dev_every, "dev_sample": self.dev_sample, "patience": self.patience, "instances": len(self.feats.instances), "features": self.feats.next_index}
+
+	def save_checkpoint(self, epoch, state, stopped):
+		'''method to write the training state at the end of an epoch to the checkpoint file, in place of the one of the epoch before'''
+		if not self.checkpoint_file:
+			return
+		with self.instrumentation.phase("checkpoint"):
+			if self.checkpoint_map is None: #the feature map is frozen, it is only pickled once per run
+				self.checkpoint_map = pickle.dumps(self.feats.mapping, -1)
+			checkpoint = {"version": CHECKPOINT_VERSION,
+				"settings": self.get_settings(),
+				"epoch": epoch, # last finished epoch
+				"stopped": stopped, # stopped early after this epoch
+				"random": random.getstate(), # shuffles the order of the next epochs
+				"best": self.best,
+				"mapping": self.checkpoint_map,
+				"state": state}
+			with atomic_write(self.checkpoint_file) as fp: #a crash leaves the checkpoint of the epoch before
+				pickle.dump(checkpoint, fp, -1) # -1 = pickle.HIGHEST_PROTOCOL
+
+	def load_checkpoint(self):
+		'''method to read the checkpoint of an interrupted run, restore the random generator and the best dev epoch from it and return it'''
+		with open(self.checkpoint_file, 'rb') as fp:
+			checkpoint = pickle.load(fp)
+		if checkpoint["version"] != CHECKPOINT_VERSION:
+			raise ValueError("%s was written by another version of the trainer" %self.checkpoint_file)
+		settings = self.get_settings()
+		changed = sorted(name for name in settings if checkpoint["settings"].get(name) != settings[name])
+		if changed:
+			raise ValueError("%s was written by a run with other settings or training data (%s)" %(self.checkpoint_file, ", ".join(changed)))
+		if pickle.loads(checkpoint["mapping"]) != self.feats.mapping:
+			raise ValueError("%s was written by a run with another feature map" %self.checkpoint_file)
+		self.checkpoint_map = checkpoint["mapping"]
+		random.setstate(checkpoint["random"])
+		self.best = checkpoint["best"]
+		self.report("Resuming from %s after epoch %i" %(self.checkpoint_file, checkpoint["epoch"]))
+		return checkpoint
+
+	def is_dev_epoch(self, epoch):
+		'''method to return True when the averaged weights of an epoch are scored on the dev sentences'''
+		return self.dev is not None and ((epoch + 1) % self.dev_every == 0 or epoch + 1 == self.epochs)
+
+	def end_epoch(self, epoch, weights):
+		'''method to score the averaged weights of an epoch on the dev sentences, returns True when training should stop'''
+		start = time.time()
+		score = self.score(weights)
+		seconds = time.time() - start
+		self.instrumentation.record_dev(score, seconds)
+		if self.best is None or score > self.best[0]:
+			self.best = (score, epoch, weights)
+		self.report("epoch: %i dev UAS %.2f (best %.2f after epoch %i, scored in %.1f sec)" %(epoch, score, self.best[0], self.best[1], seconds))
+		if self.patience is not None and epoch - self.best[1] >= self.patience * self.dev_every:
+			self.report("No better dev score for %i epochs, stopping early" %(epoch - self.best[1]))
+			return True
+		return False
+
+	def score(self, weights):
+		'''method to parse the dev sentences with averaged weights and return their unlabeled attachment score'''
+		feats = self.feats
+		model_weights = feats.weights
+		feats.weights = weights
+		guide = Guide()
+		try:
+			if self.beam_size > 1:
+				parse_sentences(self.dev_sentences, feats, guide, 1, 1, self.beam_size)
+			else: #most configurations of the greedy parse were reached by the last scoring too
+				self.dev_memo = parse_memo(self.dev_sentences, feats, guide, self.dev_memo)
+		finally:
+			feats.weights = model_weights # the beam training scores with the weights of its perceptron
+		return attachment_score(self.dev_heads, get_heads(self.dev_sentences))
+
+	def get_best_weights(self):
+		'''method to return the averaged weights of the epoch with the best dev score'''
+		score, epoch, weights = self.best
+		self.report("Keeping the averaged weights of epoch %i (dev UAS %.2f)" %(epoch, score))
+		return weights
+
+	def save(self, language, model_file = None):
+		'''method to save the trained model to model-<lang> (or another model file) and return a Parser for it'''
+		with self.instrumentation.phase("save_model"):
+			self.feats.save_model(language, model_file)
+		if self.checkpoint_file and os.path.exists(self.checkpoint_file): #the run is complete, nothing to resume
+			os.remove(self.checkpoint_file)
+		return Parser(language, model_file)
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def get_model(language, model_file = None):
+	'''return the Features of a model file from the model cache, loading the model if it is missing or out of date'''
+	path = model_file or "model-%s" % language
+	key = os.path.abspath(path)
+	mtime = os.path.getmtime(path) if os.path.exists(path) else None # None = old pickle format
+	with model_cache_lock:
+		entry = model_cache.pop(key, None)
+		if entry is None or entry[0] != mtime:
+			feats = Features()
+			feats.frozen = True
+			feats.load_model(language, model_file) # memory-maps the model file, raises IOError if a given one is missing
+			entry = (mtime, feats)
+		model_cache[key] = entry # most recently used last
+		while len(model_cache) > MODEL_CACHE_SIZE:
+			model_cache.popitem(last=False)
+	return entry[1]
+
+def extract_shard(shard):
+	'''replay the oracle over a shard of the sentences of extract_job in a worker process, returns the feature strings by row and the instances'''
+	# the feature strings go back as one newline-separated string, which pickles much faster than a list of them
+	sentences, hash_bits = extract_job
+	start, end = shard
+	trainer = Trainer(hash_bits)
+	trainer.feats = Features(hash_bits)
+	trainer.extract_instances(sentences[start:end])
+	feats = trainer.feats
+	instances = feats.instances.freeze()
+	shard_features = None # hashed rows are the same in every process
+	if not hash_bits:
+		shard_features = [None] * feats.next_index
+		for feature, index in feats.mapping.iteritems():
+			shard_features[index] = feature
+		shard_features = "\n".join(shard_features) # forms and POS tags never hold a newline
+	return shard_features, instances.transitions, instances.offsets, instances.features
+
+def get_gold_transitions(current_sentence):
+	'''return the codes of the oracle transitions of a sentence'''
+	gold_transitions = []
+	current_state = State(len(current_sentence.forms))
+	while current_state.queue:
+		tr = oracle.get_oracle_transition(current_state, current_sentence)
+		gold_transitions.append(tr.transition)
+		current_state = tr.apply_transition(current_state)
+	return gold_transitions
+
+def read_sentences(source):
+	'''return the sentences of the path of a CoNLL06 file (as views of its corpus cache) or of any iterable of Sentences'''
+	if isinstance(source, basestring):
+		return read_corpus(source)
+	return source
+
+def sample_sentences(sentences, share, seed = 333):
+	'''yield a random share of the sentences of a CoNLL06 file or an iterable, without reading them all into memory'''
+	sampler = random.Random(seed) # leaves the global generator that shuffles the instances alone
+	for current_sentence in read_sentences(sentences):
+		if sampler.random() < share:
+			yield current_sentence
+
+def clear_model_cache():
+	'''drop all models from the model cache'''
+	with model_cache_lock:
+		model_cache.clear()
@@ -0,0 +1,639 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script times the hot paths of the parser on the bundled treebanks.
+
+usage: python benchmark.py <benchmark> [en|de]
+
+benchmarks:
+	state  -- parse synthetic sentences of growing length with the trained model to check
+	          that the time per sentence grows linearly with its length
+	oracle -- replay the training oracle over the 5k-sentence training file
+	features -- feature extraction throughput while building the map on the training file and
+	          with the frozen map on the dev file, with a checksum of the produced vectors
+	hashing -- collision rate, model memory and dev accuracy of the exact feature map
+	          against hashed feature tables of several sizes, the map memory is taken right after the
+	          extraction and counts the cache of compiled keys too
+	static -- parse the dev file with the trained model with and without the per-sentence static
+	          scores and check that both give the same heads
+	workers -- parsing throughput on the dev file with 1, 2, 4 and 8 worker processes
+	batch  -- parsing throughput of the lockstep batch decoder on the dev file for several batch sizes
+	beam   -- sentences/sec and dev accuracy of the beam decoder with beams of 1 to 16 items, with the
+	          greedily trained model and with a model trained with early updates at the same beam size
+	load   -- load time of the memory-mapped model against the pickle format and a first parse with each
+	instances -- memory and shuffle time of the training instance store against Instance objects
+	ipm    -- training time and dev accuracy of iterative parameter mixing with 2 to 8 processes
+	          against the serial averaged perceptron
+	corpus -- load time and memory of all CoNLL06 files of data/ read as text against their binary
+	          corpus cache, alone and together with a pass that uses every sentence
+	extraction -- time of the serial extraction of the training instances against the parallel
+	          extraction with 2 to 8 processes, and whether the feature map and instances are the same
+	compress -- model size, load time and dev accuracy after pruning the trained model at several
+	          thresholds and storing its weights as float64, float16 and int8
+	suite  -- time every stage of training and parsing separately (reading, oracle, feature extraction,
+	          instance extraction, prediction, training epochs, model save and load, end-to-end parsing) on
+	          the 1k-sentence training file and the dev file, with tokens/sec and peak memory of each stage.
+	          The instances and epochs run through api.Trainer like trainer.py, with a checkpoint after every
+	          epoch, and once more with dev scoring
+
+suite options:
+	--output <file>    write the results as JSON to this file (default benchmark-<lang>.json, - = stdout)
+	--baseline <file>  compare the results with the JSON of an earlier run and exit with status 1 if a
+	                   stage got slower or needs more memory by more than the tolerance
+	--tolerance <x>    allowed slowdown or memory growth as a fraction (default 0.10)
+	--repeats <n>      run every stage n times and keep the fastest run (default 3)
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+import os
+import glob
+import time
+import random
+import zlib
+import hashlib
+import multiprocessing
+import tempfile
+import resource
+import json
+import platform
+import oracle
+from classes import *
+from api import Trainer, read_sentences
+from evaluate import attachment_score, get_heads
+from instrumentation import reset_peak_rss, get_peak_rss
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+output_path = None #JSON file of the suite results, None = benchmark-<lang>.json
+baseline_path = None #JSON file of an earlier suite run to compare with
+tolerance = 0.10 #allowed slowdown or memory growth of a stage before it counts as a regression
+repeats = 3 #runs of every suite stage, the fastest one counts
+log = sys.stdout #progress and tables of the suite, stderr when the JSON goes to stdout
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def make_long_sentence(sentences, length):
+	'''glue the tokens of consecutive sentences together into one sentence of the given length'''
+	long_sentence = Sentence()
+	for current_sentence in sentences:
+		for index in range(1, len(current_sentence.forms)):
+			if len(long_sentence.forms) > length:
+				return long_sentence
+			token_id = len(long_sentence.forms)
+			long_sentence.add_token([str(token_id), current_sentence.forms[index], current_sentence.lemmas[index], current_sentence.pos[index], "_",
+				current_sentence.morphs[index], "0", current_sentence.relations[index]], False)
+	return long_sentence
+
+def get_trainer(feats, **settings):
+	'''return an api.Trainer with the settings of trainer.py (or the given ones) that extracts into and trains a feature map'''
+	trainer = Trainer(**settings)
+	trainer.feats = feats
+	return trainer
+
+def parse_score(feats, sentences):
+	'''parse sentences read with gold heads and return their unlabeled attachment score'''
+	parse_sentences(sentences, feats, Guide())
+	return attachment_score(get_heads(sentences, True), get_heads(sentences))
+
+def bench_state(language, dev_file, train_file):
+	'''time parsing of sentences of length 25 to 1600 with the trained model of the language'''
+	sentences = list(read_sentences(dev_file))
+	feats = Features()
+	feats.frozen = True
+	feats.load_model(language)
+	guide = Guide()
+
+	print "%8s %12s %14s" %("length", "sec/sent", "msec/token")
+	for length in [25, 50, 100, 200, 400, 800, 1600]:
+		long_sentence = make_long_sentence(sentences, length)
+		repeats = max(1, 1600 / length)
+		start = time.time()
+		for k in range(repeats):
+			parse_sentence(long_sentence, feats, guide)
+		elapsed = (time.time() - start) / repeats
+		print "%8i %12.4f %14.4f" %(length, elapsed, 1000.0 * elapsed / length)
+
+def bench_oracle(language, dev_file, train_file):
+	'''time the oracle replay over the training file'''
+	sentences = list(read_sentences(train_file))
+	transitions = 0
+	start = time.time()
+	for current_sentence in sentences:
+		current_state = State(len(current_sentence.forms))
+		while current_state.queue:
+			tr = oracle.get_oracle_transition(current_state, current_sentence)
+			current_state = tr.apply_transition(current_state)
+			transitions += 1
+	elapsed = time.time() - start
+	print "%i sentences, %i transitions in %.2f sec (%.0f transitions/sec)" %(len(sentences), transitions, elapsed, transitions / elapsed)
+
+def time_extraction(feats, sentences):
+	'''replay the oracle over the sentences and time only the feature extraction'''
+	checksum = hashlib.md5()
+	configurations = 0
+	elapsed = 0.0
+	for current_sentence in sentences:
+		current_state = State(len(current_sentence.forms))
+		while current_state.queue:
+			start = time.time()
+			fvector = feats.extract_features(current_state, current_sentence)
+			elapsed += time.time() - start
+			checksum.update(str(fvector))
+			configurations += 1
+			current_state = oracle.get_oracle_transition(current_state, current_sentence).apply_transition(current_state)
+	return configurations, elapsed, checksum.hexdigest()
+
+def bench_features(language, dev_file, train_file):
+	'''time Features.extract_features in training mode and in frozen (parsing) mode'''
+	feats = Features()
+	configurations, elapsed, checksum = time_extraction(feats, read_sentences(train_file))
+	print "train:  %i configurations in %.2f sec (%.0f/sec) checksum %s" %(configurations, elapsed, configurations / elapsed, checksum)
+	feats.frozen = True
+	configurations, elapsed, checksum = time_extraction(feats, read_sentences(dev_file.replace(".blind", ".gold")))
+	print "frozen: %i configurations in %.2f sec (%.0f/sec) checksum %s" %(configurations, elapsed, configurations / elapsed, checksum)
+
+def bench_static(language, dev_file, train_file):
+	'''time parsing of the dev file with and without the per-sentence static scores'''
+	sentences = list(read_sentences(dev_file))
+	tokens = sum(len(current_sentence.forms) - 1 for current_sentence in sentences)
+	feats = Features()
+	feats.frozen = True
+	feats.load_model(language)
+	guide = Guide()
+	parse_sentences(sentences, feats, guide) #warm up the compiled feature table
+	heads = {}
+	best = {False: float("inf"), True: float("inf")}
+	for static_scores in [False, True] * 3: #alternate the modes and keep the best time of each
+		start = time.time()
+		parse_sentences(sentences, feats, guide, static_scores=static_scores)
+		best[static_scores] = min(best[static_scores], time.time() - start)
+		heads[static_scores] = [list(current_sentence.heads) for current_sentence in sentences]
+	print "%8s %10s %12s" %("mode", "sec", "tokens/sec")
+	for static_scores in [False, True]:
+		print "%8s %10.2f %12.0f" %("static" if static_scores else "full", best[static_scores], tokens / best[static_scores])
+	print "identical heads: %s" %(heads[False] == heads[True])
+
+def bench_workers(language, dev_file, train_file):
+	'''time parse_sentences on the dev file with 1, 2, 4 and 8 worker processes'''
+	sentences = list(read_sentences(dev_file))
+	tokens = sum(len(current_sentence.forms) - 1 for current_sentence in sentences)
+	feats = Features()
+	feats.frozen = True
+	feats.load_model(language)
+	guide = Guide()
+	parse_sentences(sentences, feats, guide) #warm up the compiled feature table the workers inherit
+	serial_heads = [list(current_sentence.heads) for current_sentence in sentences]
+
+	print "%i cpus" %multiprocessing.cpu_count()
+	print "%8s %10s %12s %10s" %("workers", "sec", "tokens/sec", "identical")
+	for workers in [1, 2, 4, 8]:
+		start = time.time()
+		parse_sentences(sentences, feats, guide, workers)
+		elapsed = time.time() - start
+		identical = [current_sentence.heads for current_sentence in sentences] == serial_heads
+		print "%8i %10.2f %12.0f %10s" %(workers, elapsed, tokens / elapsed, identical)
+
+def bench_batch(language, dev_file, train_file):
+	'''time the lockstep batch decoder on the dev file with batches of 1 to 256 sentences'''
+	sentences = list(read_sentences(dev_file))
+	tokens = sum(len(current_sentence.forms) - 1 for current_sentence in sentences)
+	feats = Features()
+	feats.frozen = True
+	feats.load_model(language)
+	guide = Guide()
+	parse_sentences(sentences, feats, guide) #warm up the compiled feature table
+	serial_heads = [list(current_sentence.heads) for current_sentence in sentences]
+
+	print "%8s %10s %12s %10s" %("batch", "sec", "tokens/sec", "identical")
+	for batch_size in [1, 4, 16, 64, 256]:
+		elapsed = float("inf")
+		for k in range(3): #best of three
+			start = time.time()
+			parse_sentences(sentences, feats, guide, 1, batch_size)
+			elapsed = min(elapsed, time.time() - start)
+		identical = [current_sentence.heads for current_sentence in sentences] == serial_heads
+		print "%8i %10.2f %12.0f %10s" %(batch_size, elapsed, tokens / elapsed, identical)
+
+def bench_beam(language, dev_file, train_file):
+	'''parse the dev file with beams of 1 to 16 items with a greedily trained model and with early-update trained models'''
+	# the models are trained on the 1k-sentence training file, a beam of 16 takes about 16 times as long as greedy training
+	train_sentences = list(read_sentences(train_file.replace("first-5k", "first-1k")))
+	gold_sentences = list(read_sentences(dev_file.replace(".blind", ".gold")))
+	start = time.time()
+	greedy = Trainer().fit(train_sentences).feats
+	greedy_time = time.time() - start
+	print "%i training sentences, %i dev sentences" %(len(train_sentences), len(gold_sentences))
+	print "%6s %10s %34s %34s" %("", "", "greedy model", "early-update model")
+	print "%6s %10s %10s %12s %10s %10s %12s %10s" %("beam", "train sec", "parse sec", "sent/sec", "UAS", "parse sec", "sent/sec", "UAS")
+	for beam_size in [1, 2, 4, 8, 16]:
+		start = time.time()
+		early = greedy if beam_size == 1 else Trainer(beam_size=beam_size).fit(train_sentences).feats
+		train_time = time.time() - start if beam_size > 1 else greedy_time
+		columns = []
+		for feats in [greedy, early]:
+			start = time.time()
+			parse_sentences(gold_sentences, feats, Guide(), 1, 1, beam_size)
+			elapsed = time.time() - start
+			columns += [elapsed, len(gold_sentences) / elapsed, attachment_score(get_heads(gold_sentences, True), get_heads(gold_sentences))]
+		print "%6i %10.1f %10.1f %12.1f %10.2f %10.1f %12.1f %10.2f" %tuple([beam_size, train_time] + columns)
+		sys.stdout.flush()
+
+def bench_load(language, dev_file, train_file):
+	'''time loading the binary model against the pickled feature map and weights, and a first parse of the dev file with each'''
+	sentences = list(read_sentences(dev_file))
+	mapped_feats = Features()
+	mapped_feats.frozen = True
+	start = time.time()
+	mapped_feats.load_model(language)
+	mapped_load = time.time() - start
+
+	# write the same model in the pickle format to temporary files
+	pickled_files = []
+	for model_part in [dict(mapped_feats.mapping.iteritems()), np.array(mapped_feats.weights)]:
+		handle, path = tempfile.mkstemp()
+		with os.fdopen(handle, 'wb') as fp:
+			pickle.dump(model_part, fp, -1)
+		pickled_files.append(path)
+	pickled_feats = Features()
+	pickled_feats.frozen = True
+	start = time.time()
+	with open(pickled_files[0], 'rb') as fp:
+		pickled_feats.mapping = pickle.load(fp)
+	with open(pickled_files[1], 'rb') as fp:
+		pickled_feats.weights = np.ascontiguousarray(pickle.load(fp), dtype=np.float64)
+	pickled_load = time.time() - start
+	for path in pickled_files:
+		os.remove(path)
+
+	guide = Guide()
+	print "%i features, model-%s is %.1f MB" %(len(mapped_feats.mapping), language, os.path.getsize("model-%s" % language) / 1e6)
+	print "%8s %10s %12s" %("format", "load sec", "parse sec")
+	heads = []
+	for name, feats, load_time in [("pickle", pickled_feats, pickled_load), ("mmap", mapped_feats, mapped_load)]:
+		start = time.time()
+		parse_sentences(sentences, feats, guide) #first parse, every feature string is looked up in the map once
+		print "%8s %10.3f %12.2f" %(name, load_time, time.time() - start)
+		heads.append([list(current_sentence.heads) for current_sentence in sentences])
+	print "identical heads: %s" %(heads[0] == heads[1])
+
+def get_rss():
+	'''return the resident memory of this process in bytes'''
+	with open("/proc/self/statm") as statm:
+		return int(statm.read().split()[1]) * resource.getpagesize()
+
+def bench_instances(language, dev_file, train_file):
+	'''compare the memory and shuffle time of the instance store with one Instance object per transition'''
+	feats = Features()
+	get_trainer(feats).extract_instances(read_sentences(train_file))
+	instances = feats.instances.freeze()
+	print "%i instances, %i feature rows" %(len(instances), len(instances.features))
+	print "%10s %10s %12s" %("store", "MB", "shuffle sec")
+	
+	order = np.arange(len(instances), dtype=np.int32)
+	start = time.time()
+	random.shuffle(order)
+	print "%10s %10.1f %12.2f" %("arrays", (instances.nbytes() + order.nbytes) / 1e6, time.time() - start)
+	
+	# the same instances as Instance objects holding lists of python ints, as they were kept before the store
+	# (the int objects of the rows are shared with the feature map and not counted)
+	rows = range(feats.next_index)
+	rss = get_rss()
+	objects = [Instance(int(instances.transitions[index]), [rows[row] for row in instances.get_fvector(index)]) for index in range(len(instances))]
+	objects_bytes = get_rss() - rss
+	start = time.time()
+	random.shuffle(objects)
+	print "%10s %10.1f %12.2f" %("objects", objects_bytes / 1e6, time.time() - start)
+
+def bench_ipm(language, dev_file, train_file):
+	'''time training with iterative parameter mixing over 1 to 8 processes against the serial perceptron, with dev accuracy'''
+	feats = Features()
+	get_trainer(feats).extract_instances(read_sentences(train_file))
+	gold_sentences = list(read_sentences(dev_file.replace(".blind", ".gold")))
+	print "%i instances, %i cpus" %(len(feats.instances), multiprocessing.cpu_count())
+	print "%8s %10s %8s %8s" %("workers", "train sec", "speedup", "UAS")
+	serial_time = None
+	for workers in [1, 2, 4, 8]: #1 = the serial averaged perceptron of trainer.py
+		start = time.time()
+		get_trainer(feats, workers=workers).train()
+		elapsed = time.time() - start
+		serial_time = serial_time or elapsed
+		uas = parse_score(feats, gold_sentences)
+		print "%8s %10.1f %8.2f %8.2f" %(workers if workers > 1 else "serial", elapsed, serial_time / elapsed, uas)
+
+def get_map_bytes(feats):
+	'''return the memory taken by the feature strings of a feature map and by its cache of compiled keys'''
+	size = 0
+	for table in [feats.mapping, feats.compiled, feats.previous_compiled]:
+		size += sys.getsizeof(table) + sum(sys.getsizeof(key) + sys.getsizeof(index) for key, index in table.iteritems())
+	return size
+
+def bench_hashing(language, dev_file, train_file):
+	'''compare the exact feature map with hashed tables of 2^16 to 2^22 rows'''
+	train_sentences = list(read_sentences(train_file))
+	gold_sentences = list(read_sentences(dev_file.replace(".blind", ".gold")))
+	print "%8s %10s %10s %10s %10s %8s" %("mode", "rows", "collide %", "map MB", "weights MB", "UAS")
+	
+	exact_feats = Features()
+	trainer = get_trainer(exact_feats)
+	trainer.extract_instances(train_sentences)
+	map_bytes = get_map_bytes(exact_feats) # the compiled keys are dropped once training starts
+	trainer.train()
+	exact_feats.instances = InstanceStore()
+	n_features = len(exact_feats.mapping)
+	uas = parse_score(exact_feats, gold_sentences)
+	print "%8s %10i %10.2f %10.1f %10.1f %8.2f" %("exact", n_features, 0.0, map_bytes / 1e6, exact_feats.weights.nbytes / 1e6, uas)
+	
+	for hash_bits in [16, 18, 20, 22]:
+		# share of the training features that land in a row already taken by another feature
+		buckets = set(zlib.crc32(feat) & ((1 << hash_bits) - 1) for feat in exact_feats.mapping)
+		collision_rate = 100.0 * (n_features - len(buckets)) / n_features
+		hashed_feats = Features(hash_bits)
+		trainer = get_trainer(hashed_feats, hash_bits=hash_bits)
+		trainer.extract_instances(train_sentences)
+		map_bytes = get_map_bytes(hashed_feats)
+		trainer.train()
+		hashed_feats.instances = InstanceStore()
+		uas = parse_score(hashed_feats, gold_sentences)
+		print "%8s %10i %10.2f %10.1f %10.1f %8.2f" %("hash-%i" %hash_bits, hashed_feats.next_index, collision_rate, map_bytes / 1e6, hashed_feats.weights.nbytes / 1e6, uas)
+
+def bench_compress(language, dev_file, train_file):
+	'''model size, load time and dev accuracy after pruning and quantizing the trained model at several settings'''
+	feats = Trainer().fit(read_sentences(train_file)).feats
+	counts = np.bincount(feats.instances.features, minlength=feats.next_index) # instances per feature
+	feats.instances = InstanceStore()
+	gold_sentences = list(read_sentences(dev_file.replace(".blind", ".gold")))
+	handle, model_file = tempfile.mkstemp()
+	os.close(handle)
+	print "%i features" %feats.next_index
+	print "%10s %10s %8s %10s %10s %8s" %("pruning", "features", "weights", "MB", "load ms", "UAS")
+	# (name, min_weight, min_count), min_weight None = no pruning
+	settings = [("none", None, 0), ("zero", 0.0, 0), ("count>=2", 0.0, 2), ("|w|>0.5", 0.5, 0), ("|w|>1", 1.0, 0)]
+	try:
+		for name, min_weight, min_count in settings:
+			pruned = Features()
+			pruned.mapping = dict(feats.mapping)
+			pruned.weights = feats.weights
+			pruned.next_index = feats.next_index
+			if min_weight is not None:
+				pruned.prune(min_weight, counts, min_count)
+			for weight_format in WEIGHT_FORMATS:
+				pruned.save_model(language, model_file, weight_format)
+				loaded = Features()
+				loaded.frozen = True
+				start = time.time()
+				loaded.load_model(language, model_file)
+				load_time = time.time() - start
+				uas = parse_score(loaded, gold_sentences)
+				print "%10s %10i %8s %10.1f %10.1f %8.2f" %(name, pruned.next_index, weight_format, os.path.getsize(model_file) / 1e6, 1000 * load_time, uas)
+				sys.stdout.flush()
+	finally:
+		os.remove(model_file)
+
+def bench_extraction(language, dev_file, train_file):
+	'''time the serial instance extraction against the parallel two-pass extraction with 2 to 8 processes'''
+	sentences = list(read_sentences(train_file))
+	print "%i sentences, %i cpus" %(len(sentences), multiprocessing.cpu_count())
+	print "%8s %10s %8s %10s" %("workers", "sec", "speedup", "identical")
+	serial = None
+	for workers in [1, 2, 4, 8]: #1 = the serial extraction of trainer.py
+		trainer = get_trainer(Features(), extract_workers=workers)
+		start = time.time()
+		trainer.extract_instances(sentences)
+		elapsed = time.time() - start
+		instances = trainer.feats.instances.freeze()
+		result = (trainer.feats.mapping, instances.transitions.tobytes(), instances.offsets.tobytes(), instances.features.tobytes())
+		serial = serial or (elapsed, result)
+		print "%8s %10.2f %8.2f %10s" %(workers if workers > 1 else "serial", elapsed, serial[0] / elapsed, result == serial[1])
+		sys.stdout.flush()
+
+def measure_reading(task):
+	'''read a CoNLL06 file as text or from its corpus cache in a fresh worker process and return the seconds and the memory taken'''
+	path, mode = task
+	rss = get_rss()
+	start = time.time()
+	if mode == "text":
+		with open(path, 'rb') as input_file:
+			sentences = list(read_conll(input_file, not path.endswith(".blind")))
+	else:
+		sentences = read_corpus(path)
+	load_time = time.time() - start
+	load_rss = get_rss() - rss
+	# what training and parsing use of every sentence: the length and the atoms of the forms and POS tags
+	for current_sentence in sentences:
+		len(current_sentence.forms)
+		current_sentence.get_atoms()
+	return load_time, time.time() - start, load_rss
+
+def bench_corpus(language, dev_file, train_file):
+	'''load time and memory of the bundled CoNLL06 files read as text against their binary corpus cache'''
+	print "%-62s %8s %10s %10s %10s" %("file", "reading", "load sec", "+use sec", "MB")
+	for path in sorted(glob.glob("./data/*/*/*.conll06*")):
+		if path.endswith(".corpus") or path.endswith(".instances"):
+			continue
+		if os.path.exists(path + ".corpus"):
+			os.remove(path + ".corpus")
+		for mode in ["text", "build", "cache"]: #build = first read that writes the cache
+			pool = multiprocessing.Pool(1) # a fresh process for every measurement, so memory freed before does not hide the cost
+			load_time, use_time, load_rss = pool.apply(measure_reading, ((path, mode),))
+			pool.terminate()
+			pool.join()
+			print "%-62s %8s %10.3f %10.3f %10.1f" %(os.path.relpath(path, "./data"), mode, load_time, use_time, load_rss / 1e6)
+			sys.stdout.flush()
+
+def count_tokens(sentences):
+	'''return the number of tokens of sentences without their root'''
+	return sum(len(current_sentence.forms) - 1 for current_sentence in sentences)
+
+def run_stage(name, stage, tokens):
+	'''run a suite stage repeats times and return its fastest time, tokens/sec and peak memory as a dict'''
+	# a stage returns the seconds of the part it measures, so setup work like fresh copies of the input is not timed
+	reset_peak_rss()
+	seconds = min(stage() for k in range(repeats))
+	result = {"name": name, "seconds": seconds, "tokens": tokens,
+		"tokens_per_sec": tokens / seconds if tokens else None,
+		"peak_rss_mb": get_peak_rss() / 1e6}
+	if tokens:
+		print >> log, "%16s %10.3f %12.0f %10.1f" %(name, seconds, result["tokens_per_sec"], result["peak_rss_mb"])
+	else:
+		print >> log, "%16s %10.3f %12s %10.1f" %(name, seconds, "-", result["peak_rss_mb"])
+	log.flush()
+	return result
+
+def time_reading(path):
+	'''time reading a CoNLL06 file as text into sentences'''
+	start = time.time()
+	with open(path, 'rb') as input_file:
+		list(read_conll(input_file))
+	return time.time() - start
+
+def time_oracle(sentences):
+	'''time the oracle replay over sentences'''
+	start = time.time()
+	for current_sentence in sentences:
+		current_state = State(len(current_sentence.forms))
+		while current_state.queue:
+			current_state = oracle.get_oracle_transition(current_state, current_sentence).apply_transition(current_state)
+	return time.time() - start
+
+def time_prediction(instances, weights):
+	'''time Guide.predict_transition on the feature vectors of all instances'''
+	guide = Guide()
+	start = time.time()
+	for index in range(len(instances)):
+		guide.predict_transition(instances.get_fvector(index), weights)
+	return time.time() - start
+
+def time_instances(sentences):
+	'''time Trainer.extract_instances on sentences, returns the seconds and the Features with the instances'''
+	feats = Features()
+	trainer = get_trainer(feats)
+	start = time.time()
+	trainer.extract_instances(sentences)
+	return time.time() - start, feats
+
+def time_training(feats, checkpoint_file, dev_file = None):
+	'''time Trainer.train on the extracted instances like trainer.py: 10 epochs with a checkpoint after every epoch (and dev scoring)'''
+	# without patience all 10 epochs run, so the runs with dev scoring stay comparable
+	trainer = get_trainer(feats, checkpoint_file=checkpoint_file, dev=dev_file)
+	start = time.time()
+	trainer.train()
+	return time.time() - start
+
+def time_save(feats, model_file):
+	'''time writing the binary model file'''
+	start = time.time()
+	feats.save_model(language, model_file)
+	return time.time() - start
+
+def time_load(model_file):
+	'''time memory-mapping the binary model file'''
+	start = time.time()
+	Features().load_model(language, model_file)
+	return time.time() - start
+
+def time_parsing(model_file, path):
+	'''time parser.py end to end: load the model, read, parse and write the sentences of a file'''
+	start = time.time()
+	feats = Features()
+	feats.frozen = True
+	feats.load_model(language, model_file)
+	with open(path, 'rb') as input_file:
+		with open(os.devnull, 'wb') as output_file:
+			write_conll(output_file, parse_stream(read_conll(input_file, False), feats, Guide()))
+	return time.time() - start
+
+def compare_results(results, baseline):
+	'''print the change of every stage against a baseline run and return the names of the stages that regressed'''
+	baseline_stages = dict((stage["name"], stage) for stage in baseline["stages"])
+	regressions = []
+	print >> log, "%16s %12s %12s %8s %10s %10s %8s" %("stage", "baseline", "current", "speed", "base MB", "MB", "")
+	for stage in results["stages"]:
+		base = baseline_stages.get(stage["name"])
+		if base is None:
+			continue
+		speed = base["seconds"] / stage["seconds"] # > 1 = faster than the baseline
+		slower = speed < 1 - tolerance and stage["seconds"] - base["seconds"] > 0.01 #ignore timer noise of very short stages
+		bigger = stage["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance)
+		flag = " ".join(word for word, regressed in [("SLOWER", slower), ("MEMORY", bigger)] if regressed)
+		if flag:
+			regressions.append(stage["name"])
+		print >> log, "%16s %11.3fs %11.3fs %7.2fx %10.1f %10.1f %8s" %(stage["name"], base["seconds"], stage["seconds"], speed, base["peak_rss_mb"], stage["peak_rss_mb"], flag)
+	return regressions
+
+def bench_suite(language, dev_file, train_file):
+	'''time every stage of training and parsing separately and write the results as JSON'''
+	train_file = train_file.replace("first-5k", "first-1k") # keeps a full run of the suite at a few minutes
+	train_sentences = list(read_sentences(train_file))
+	train_tokens = count_tokens(train_sentences)
+	dev_tokens = count_tokens(read_sentences(dev_file))
+	handle, model_file = tempfile.mkstemp()
+	os.close(handle)
+	checkpoint_file = model_file + ".checkpoint"
+	print >> log, "%s: %i training tokens, %i dev tokens, best of %i runs" %(language, train_tokens, dev_tokens, repeats)
+	print >> log, "%16s %10s %12s %10s" %("stage", "sec", "tokens/sec", "peak MB")
+
+	stages = []
+	try:
+		stages.append(run_stage("read_conll", lambda: time_reading(train_file), train_tokens))
+		stages.append(run_stage("oracle", lambda: time_oracle(train_sentences), train_tokens))
+		# feature extraction while building the map, only the extract_features calls are timed
+		stages.append(run_stage("extract_features", lambda: time_extraction(Features(), train_sentences)[1], train_tokens))
+		stages.append(run_stage("instances", lambda: time_instances(train_sentences)[0], train_tokens))
+		feats = time_instances(train_sentences)[1]
+		stages.append(run_stage("train_epochs", lambda: time_training(feats, checkpoint_file), 10 * train_tokens))
+		stages.append(run_stage("train_dev", lambda: time_training(feats, checkpoint_file, dev_file.replace(".blind", ".gold")), 10 * train_tokens))
+		stages.append(run_stage("predict", lambda: time_prediction(feats.instances, feats.weights), train_tokens))
+		stages.append(run_stage("save_model", lambda: time_save(feats, model_file), 0))
+		stages.append(run_stage("load_model", lambda: time_load(model_file), 0))
+		stages.append(run_stage("parse", lambda: time_parsing(model_file, dev_file), dev_tokens))
+	finally:
+		os.remove(model_file)
+		if os.path.exists(checkpoint_file):
+			os.remove(checkpoint_file)
+
+	results = {"language": language, "train_file": train_file, "dev_file": dev_file, "repeats": repeats,
+		"python": platform.python_version(), "numpy": np.__version__, "cpus": multiprocessing.cpu_count(),
+		"stages": stages, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3}
+	path = output_path or "benchmark-%s.json" % language
+	if path == "-":
+		json.dump(results, sys.stdout, indent=1, sort_keys=True)
+		print
+	else:
+		with open(path, 'w') as output_file:
+			json.dump(results, output_file, indent=1, sort_keys=True)
+		print >> log, "results written to %s" %path
+
+	if baseline_path:
+		with open(baseline_path) as baseline_file:
+			regressions = compare_results(results, json.load(baseline_file))
+		if regressions:
+			print >> log, "regressions (tolerance %.0f%%): %s" %(100 * tolerance, ", ".join(regressions))
+			sys.exit(1)
+		print >> log, "no regressions (tolerance %.0f%%)" %(100 * tolerance)
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+benchmarks = {"state": bench_state, "oracle": bench_oracle, "features": bench_features, "hashing": bench_hashing, "static": bench_static, "workers": bench_workers, "batch": bench_batch, "beam": bench_beam, "load": bench_load, "instances": bench_instances, "ipm": bench_ipm, "suite": bench_suite, "compress": bench_compress, "extraction": bench_extraction, "corpus": bench_corpus}
+language = "english"
+dev_file = "./data/english/dev/wsj_dev.conll06.blind"
+train_file = "./data/english/train/wsj_train.only-projective.first-5k.conll06"
+if "de" in [str(arg).lower() for arg in sys.argv]:
+	language = "german"
+	dev_file = "./data/german/dev/tiger-2.2.dev.conll06.blind"
+	train_file = "./data/german/train/tiger-2.2.train.only-projective.first-5k.conll06"
+
+if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+	print "usage: python benchmark.py <%s> [en|de] [suite options]" %"|".join(sorted(benchmarks))
+	sys.exit(1)
+
+for i, arg in enumerate(sys.argv):
+	if arg == "--output":
+		output_path = sys.argv[i + 1]
+	elif arg == "--baseline":
+		baseline_path = sys.argv[i + 1]
+	elif arg == "--tolerance":
+		tolerance = float(sys.argv[i + 1])
+	elif arg == "--repeats":
+		repeats = int(sys.argv[i + 1])
+if output_path == "-":
+	log = sys.stderr
+
+benchmarks[sys.argv[1]](language, dev_file, train_file)
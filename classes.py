@@ -12,8 +12,120 @@ This script creates data classes for the transition-based dependency parser.
 *******  imports  *********
 ******* ********* *********
 '''
+from array import array
 from collections import deque
+from contextlib import contextmanager
+from itertools import chain, islice
 import cPickle as pickle
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+import numpy as np
+
+'''
+******* ********* *********
+******* constants *********
+******* ********* *********
+'''
+FEATURE_VERSION = 1 # version of the feature templates in Features.extract_features, bump it whenever they change
+
+# binary model file, see Features.save_model: a 64 byte header (magic, model version, feature version, hash bits,
+# weight format, number of weight rows, number of feature strings, number of hash buckets, size of the string blob,
+# weight scale) followed by the n * 4 weights (padded to 8 bytes), the n + 1 string offsets (uint64), the hash
+# buckets (int32) and the feature strings
+MODEL_MAGIC = "TBDPMODL"
+MODEL_VERSION = 2 # version 1 files have no weight format and scale (zeros in their place) and are read as float64
+MODEL_HEADER = struct.Struct("<8sIIIIQQQQd")
+
+# formats of the saved weights by their code in the model header, float16 and int8 weights are multiplied
+# by the scale of the header and expanded to float64 when the model is loaded
+WEIGHT_FORMATS = ["float64", "float16", "int8"]
+WEIGHT_DTYPES = {"float64": "<f8", "float16": "<f2", "int8": "i1"}
+
+# feature templates in the order Features.extract_features produces them, filled in with the strings of a key's atoms
+FEATURE_TEMPLATES = [
+	# Unigrams
+	"s0form,pos=%s,%s", #stack top word form and POS
+	"s0form=%s", #stack top word form
+	"s0pos=%s", #stack top POS tag
+	"b0form,pos=%s,%s", #buffer front word form and POS
+	"b0form=%s", #buffer front word form
+	"b0pos=%s", #buffer front POS tag
+	"b1form,pos=%s,%s", #buffer 2nd item word form and POS
+	"b1form=%s", #buffer 2nd item word form
+	"b1pos=%s", #buffer 2nd item POS tag
+	"b2form,pos=%s,%s", #buffer 3rd item word form and POS
+	"b2form=%s", #buffer 3rd item word form
+	"b2pos=%s", #buffer 3rd item POS tag
+	"s1pos=%s", #stack 2nd top item POS tag
+	"ldb0pos=%s", #POS of left most dependent of buffer front
+	# Bigrams
+	"s0form,pos=%s,%s+b0form,pos=%s,%s", #stack top and buffer front word form and POS
+	"s0form,pos=%s,%s+b0form=%s", #stack top word form and POS and buffer front word
+	"s0form=%s+b0form,pos=%s,%s", #stack top form and buffer front word form and POS
+	"s0form,pos=%s,%s+b0pos=%s", #stack top word form and POS and buffer POS
+	"s0pos=%s+b0form,pos=%s,%s", #stack top pos and buffer front word form, POS
+	"s0form=%s+b0form=%s", #stack top and buffer front word form
+	"s0pos=%s+b0pos=%s", #stack top and buffer front POS
+	"b0pos=%s+b1pos=%s", #buffer front and second POS
+	# Trigrams
+	"b0pos=%s+b1pos=%s+b2pos=%s", #buffer front, second, 3rd POS
+	"s0pos=%s+b0pos=%s+b1pos=%s", #stack top, buffer front, buffer second POS
+	"hs0pos=%s+s0pos=%s+b0pos=%s", #head of stack top, stack top, buffer front POS
+	"s0pos=%s+lds0pos=%s+b0pos=%s", #stack top, its left most dependent, buffer front POS
+	"s0pos=%s+rds0pos=%s+b0pos=%s", #stack top, its right most dependent, buffer front POS
+	"s0pos=%s+b0pos=%s+ldb0pos=%s", #stack top, buffer front, left most dependent of buffer front POS
+	# distance features
+	"s0form,d=%s,%s", #stack top word form and distance
+	"s0pos,d=%s,%s", #stack top POS and distance
+	"b0form,d=%s,%s", #buffer front word form and distance
+	"b0pos,d=%s,%s", #buffer front POS tag and distance
+	"s0form=%s+b0form,d=%s,%s", #stack top word form and buffer front word form + distance
+	"s0pos=%s+b0pos,d=%s,%s"] #stack top POS and buffer front POS + distance
+
+# atoms of the dummy form and POS used for missing tokens and of the distances 0-9 and 10+
+NULL_FORM_ATOM = 0
+NULL_POS_ATOM = 1
+DISTANCE_ATOMS = range(2, 13)
+
+# single-token slots (s0, b0, b1, b2, s1, ldb0) and the templates that only look at the token in that slot
+STATIC_SLOTS = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (9, 10, 11), (12,), (13,)]
+STATIC_TEMPLATE_COUNT = 14 # the static templates are the first ones in FEATURE_TEMPLATES
+STATIC_ROWS = 6 * 256 # static score rows kept after the weight rows, enough for sentences of 254 words, see reserve_static_rows
+
+COMPILED_CACHE_SIZE = 1 << 16 # compiled keys per generation of the cache of Features.lookup_features
+MAX_ATOMS = 1 << 18 # interned strings a parsing process keeps (about 30 MB) before it drops them, see trim_atoms
+PARSE_CHUNK_SIZE = 64 # sentences per task of the parse workers
+PARSE_MEMO_CHUNK_SIZE = 4096 # configurations scored with one gather by ParseMemo.get_scores
+
+# corpus cache of a CoNLL06 file, see read_corpus: the interned string columns with the CoNLL06 column they come
+# from and the string of the artificial root token, the heads are stored as numbers (-1 = "_")
+CORPUS_VERSION = 1
+CORPUS_COLUMNS = [("forms", 1, "ROOT"), ("lemmas", 2, "ROOT"), ("pos", 3, "ROOT_POS"), ("morphs", 5, "ROOT_Morph"), ("relations", 7, "root_REL")]
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+# vocabulary shared by all feature maps that interns forms, POS tags and distances to integer atoms
+atom_strings = ["NULL", "NULL_POS"] + [str(distance) for distance in range(10)] + ["10+"]
+atom_ids = dict((string, atom) for atom, string in enumerate(atom_strings))
+atom_lock = threading.Lock() # new atoms are added under it, so sentences parsed in several threads get the same atoms
+fixed_atoms = len(atom_strings) # the NULL and distance atoms are never dropped
+atom_generation = 0 # bumped whenever atoms are dropped, atoms of sentences and compiled keys of another generation are made again
+active_parses = 0 # parse_stream calls running in the threads of this process, see trim_atoms
+
+# model of the running parse_stream call, inherited by the forked parse workers
+parse_job = None
+# instances and shared weight matrices of the running train_mixed call, inherited by the forked training workers
+train_job = None
 
 '''
 ******* ********* *********
@@ -31,7 +143,11 @@ class Sentence:
 		self.morphs = ["ROOT_Morph"]
 		self.heads = ["_"]
 		self.relations = ["root_REL"]
-		self.gold_arcs = []       
+		self.gold_heads = [-1] #gold head of each token (root has none)
+		self.gold_child_counts = [0] #number of gold dependents of each token
+		self.form_atoms = None #interned forms and POS tags, filled in by get_atoms
+		self.pos_atoms = None
+		self.atoms_generation = None #atom generation of form_atoms and pos_atoms
     
 	def add_token(self, token, training = True):
 		self.forms.append(token[1])
@@ -41,7 +157,118 @@ class Sentence:
 		self.heads.append(token[6])
 		self.relations.append(token[7])
 		if training:
-			self.gold_arcs.append((int(token[6]), int(token[0]))) 
+			head = int(token[6])
+			self.gold_heads.append(head)
+			# the head may come later in the sentence, so grow the counts to cover it
+			missing = max(head, len(self.forms) - 1) + 1 - len(self.gold_child_counts)
+			if missing > 0:
+				self.gold_child_counts.extend([0] * missing)
+			self.gold_child_counts[head] += 1
+
+	def get_atoms(self):
+		'''method to intern the forms and POS tags of the sentence (once per atom generation) and return them'''
+		generation = atom_generation
+		if self.atoms_generation != generation:
+			# the NULL atoms are added at the end, so token -1 (a missing token) maps to them
+			self.form_atoms = [get_atom(form) for form in self.forms] + [NULL_FORM_ATOM]
+			self.pos_atoms = [get_atom(tag) for tag in self.pos] + [NULL_POS_ATOM]
+			self.atoms_generation = generation
+		return self.form_atoms, self.pos_atoms
+
+class SentenceView(Sentence):
+	'Sentence of a Corpus, its lists are only built from the arrays of the corpus when they are first used'
+	def __init__(self, corpus, index):
+		self.corpus = corpus
+		self.start = int(corpus.offsets[index])
+		self.end = int(corpus.offsets[index + 1])
+		self.atoms_generation = None
+	
+	def __getattr__(self, name):
+		'''build a list of the sentence the first time it is used, it is kept in the instance from then on'''
+		corpus = self.__dict__.get("corpus")
+		if corpus is None or name not in corpus.vocabularies and name not in ["heads", "gold_heads", "gold_child_counts"]:
+			raise AttributeError(name)
+		heads = corpus.heads[self.start:self.end]
+		if name == "heads": #as read, strings like the heads of Sentence.add_token
+			value = ["_"] + [str(head) if head != -1 else "_" for head in heads.tolist()]
+		elif name == "gold_heads":
+			value = [-1] + heads.tolist()
+		elif name == "gold_child_counts":
+			value = np.bincount(heads[heads != -1], minlength=len(heads) + 1).tolist()
+		else:
+			vocabulary = corpus.vocabularies[name]
+			value = [vocabulary[0]] + [vocabulary[string_id] for string_id in corpus.columns[name][self.start:self.end].tolist()]
+		setattr(self, name, value)
+		return value
+	
+	def __getstate__(self):
+		'''pickle the view (for the parse workers) as a plain sentence without the corpus and without the atoms of this process'''
+		state = dict((name, getattr(self, name)) for name in ["forms", "lemmas", "pos", "morphs", "heads", "relations", "gold_heads", "gold_child_counts"])
+		state["form_atoms"] = None
+		state["pos_atoms"] = None
+		state["atoms_generation"] = None
+		return state
+	
+	def get_atoms(self):
+		'''method to look up the atoms of the sentence in the atom maps of its corpus (once per atom generation) and return them'''
+		corpus = self.__dict__.get("corpus")
+		if corpus is None: #pickled without the corpus
+			return Sentence.get_atoms(self)
+		generation = atom_generation
+		if self.atoms_generation != generation:
+			# the NULL atoms are added at the end, so token -1 (a missing token) maps to them, like Sentence.get_atoms
+			self.form_atoms = [get_atom("ROOT")] + corpus.get_atoms("forms", self.start, self.end) + [NULL_FORM_ATOM]
+			self.pos_atoms = [get_atom("ROOT_POS")] + corpus.get_atoms("pos", self.start, self.end) + [NULL_POS_ATOM]
+			self.atoms_generation = generation
+		return self.form_atoms, self.pos_atoms
+
+class Corpus:
+	'Sentences of a CoNLL06 file with interned string columns: token columns in flat arrays, sentence i has the tokens offsets[i] to offsets[i+1]'
+	def __init__(self, vocabularies, columns, heads, offsets):
+		self.vocabularies = vocabularies # column name -> strings by id, id 0 is the string of the root token
+		self.columns = columns # column name -> int32 ids of the strings of all tokens
+		self.heads = heads # int32 heads of all tokens, -1 = "_"
+		self.offsets = offsets # int64
+		self.atom_maps = {} # column name -> atoms by string id, filled in by get_atoms
+		self.atoms_generation = atom_generation # atom generation of the atom maps
+	
+	def get_atoms(self, name, start, end):
+		'''method to return the atoms of a column of the tokens start to end, every string is interned the first time it is used'''
+		if self.atoms_generation != atom_generation: #the atoms were dropped since, they are interned again
+			self.atom_maps = {}
+			self.atoms_generation = atom_generation
+		atom_map = self.atom_maps.get(name)
+		if atom_map is None: # atoms by string id, -1 = not interned yet
+			atom_map = self.atom_maps[name] = np.full(len(self.vocabularies[name]), -1, dtype=np.int64)
+		ids = self.columns[name][start:end]
+		atoms = atom_map[ids]
+		missing = np.flatnonzero(atoms == -1)
+		if len(missing):
+			vocabulary = self.vocabularies[name]
+			for position in missing.tolist():
+				atoms[position] = atom_map[ids[position]] = get_atom(vocabulary[ids[position]])
+		return atoms.tolist()
+	
+	def save(self, cache_file, source_file):
+		'''method to write the corpus to a binary cache for the source file'''
+		cache = {"version": CORPUS_VERSION,
+			"source": get_source_key(source_file),
+			"vocabularies": self.vocabularies,
+			"columns": self.columns,
+			"heads": self.heads,
+			"offsets": self.offsets}
+		with atomic_write(cache_file) as fp:
+			pickle.dump(cache, fp, -1) # -1 = pickle.HIGHEST_PROTOCOL
+	
+	def __getitem__(self, index):
+		return SentenceView(self, index)
+	
+	def __iter__(self):
+		for index in range(len(self)):
+			yield SentenceView(self, index)
+	
+	def __len__(self):
+		return len(self.offsets) - 1
 
 class State:
 	'Class to represent the current state of the parser. It has a buffer, stack, current arcs and dependents'
@@ -49,10 +276,24 @@ class State:
 		self.arcs = []
 		self.queue = deque()
 		self.stack = [0]
-		self.left_most = [-1] * sentence_length  #left-most dependents
-		self.right_most = [-1] * sentence_length #right-most dependents
+		self.heads = [-1] * sentence_length  #head of each token (-1 = no head yet)
+		self.left_most = [-1] * sentence_length  #left-most (smallest index) dependents
+		self.right_most = [-1] * sentence_length #right-most (largest index) dependents
+		self.dependent_counts = [0] * sentence_length #number of dependents attached to each token
 		for i in range (1, sentence_length):
 			self.queue.append(i)
+	
+	def copy(self):
+		'''return a copy of the state that can take other transitions than this one (beam search)'''
+		other = State(0)
+		other.arcs = list(self.arcs)
+		other.queue = deque(self.queue)
+		other.stack = list(self.stack)
+		other.heads = list(self.heads)
+		other.left_most = list(self.left_most)
+		other.right_most = list(self.right_most)
+		other.dependent_counts = list(self.dependent_counts)
+		return other
 
 class Transition:
 	'Class that defines and applies transitions'
@@ -71,224 +312,786 @@ class Transition:
 		else:
 			return do_shift(current_state)
 
+class BeamItem:
+	'An item of the beam search: a parser state, the summed score of the transitions that led to it and their history'
+	def __init__(self, score, state, history, gold):
+		self.score = score
+		self.state = state
+		self.history = history # (history of the item it came from, feature vector, transition code), None at the start
+		self.gold = gold # all transitions so far are the gold ones (training only)
+
 class Instance:
 	'Class to map indexes of weight to transition codes'
 	def __init__(self, code, feat_vector):
 		self.transition= code
 		self.fvector = feat_vector
 		
+class InstanceStore:
+	'Training instances stored CSR-style in three flat arrays instead of one Instance object per transition'
+	def __init__(self, transitions = None, offsets = None, features = None):
+		# instance i has the gold transition transitions[i] and the feature rows features[offsets[i]:offsets[i+1]],
+		# the arrays grow as compact array buffers until freeze turns them into numpy arrays
+		if transitions is None:
+			self.transitions = array('B') # uint8
+			self.offsets = array('l', [0]) # C long, see get_int64_array
+			self.features = array('i') # int32
+			self.frozen = False
+		else:
+			self.transitions = transitions
+			self.offsets = offsets
+			self.features = features
+			self.frozen = True
+	
+	def append(self, transition, fvector):
+		'''method to add the instance of one configuration'''
+		self.transitions.append(transition)
+		self.features.extend(fvector)
+		self.offsets.append(len(self.features))
+	
+	def freeze(self):
+		'''method to turn the buffers into numpy arrays (without copying them), no instances can be added afterwards'''
+		if not self.frozen:
+			self.transitions = np.frombuffer(self.transitions, dtype=np.uint8)
+			self.offsets = get_int64_array(self.offsets)
+			self.features = np.frombuffer(self.features, dtype=np.int32)
+			self.frozen = True
+		return self
+	
+	def get_fvector(self, index):
+		return self.features[self.offsets[index]:self.offsets[index + 1]]
+	
+	def nbytes(self):
+		'''return the memory taken by the arrays'''
+		return sum(len(data) * data.itemsize for data in [self.transitions, self.offsets, self.features])
+	
+	def __len__(self):
+		return len(self.transitions)
+
+class ParseMemo:
+	'Feature vectors of the configurations that a greedy parse of a fixed list of sentences reached, for parsing them again with other weights'
+	def __init__(self, n_sentences):
+		# the configurations are the nodes of a tree of transitions per sentence, their feature vectors are stored
+		# CSR-style like the instances of InstanceStore
+		self.starts = [-1] * n_sentences # node of the start state of every sentence, -1 = not parsed yet
+		self.children = {} # (node, transition code) -> node of the configuration the transition leads to
+		self.offsets = array('l', [0]) # node i has the feature rows features[offsets[i]:offsets[i+1]], see get_int64_array
+		self.features = array('i')
+	
+	def add(self, fvector, sentence_index, link):
+		'''method to add the configuration of a sentence that a (node, transition code) link leads to (None = the start state)'''
+		node = len(self.offsets) - 1
+		self.features.extend(fvector)
+		self.offsets.append(len(self.features))
+		if link is None:
+			self.starts[sentence_index] = node
+		else:
+			self.children[link] = node
+		return node
+	
+	def get_features(self, node):
+		'''method to return the feature vector of a configuration'''
+		return self.features[self.offsets[node]:self.offsets[node + 1]]
+	
+	def get_scores(self, weight_matrix):
+		'''method to score all configurations with one gather per chunk of them, returns their 4 scores as lists'''
+		# the vectors are padded like in Guide.score_transitions, so the rows of every configuration are added up in
+		# the same order as in predict_transition and the scores are exactly the same
+		offsets = get_int64_array(self.offsets)
+		features = np.frombuffer(self.features, dtype=np.int32)
+		lengths = np.diff(offsets)
+		scores = []
+		for start in range(0, len(lengths), PARSE_MEMO_CHUNK_SIZE):
+			chunk_lengths = lengths[start:start + PARSE_MEMO_CHUNK_SIZE]
+			width = max(int(chunk_lengths.max()), 1)
+			used = np.arange(width) < chunk_lengths[:, np.newaxis]
+			index = np.zeros(used.shape, dtype=np.intp)
+			index[used] = features[offsets[start]:offsets[start + len(chunk_lengths)]] # row-major, the order of the vectors
+			rows = weight_matrix[index] # chunk * width * 4
+			rows *= used[:, :, np.newaxis]
+			scores.extend(rows.sum(axis=1).tolist())
+		return scores
+
+class FeatureTable:
+	'Read-only feature map of a binary model file, looked up in place in the memory-mapped file'
+	def __init__(self, buffer, offset, n_features, n_buckets):
+		# feature i has weight row i, its string is the bytes offsets[i] to offsets[i+1] of the string blob
+		self.offsets = np.frombuffer(buffer, dtype="<u8", count=n_features + 1, offset=offset)
+		offset += self.offsets.nbytes
+		# open addressing hash table on crc32 with linear probing, the buckets hold feature numbers (-1 = empty)
+		self.buckets = np.frombuffer(buffer, dtype="<i4", count=n_buckets, offset=offset)
+		self.buffer = buffer
+		self.strings_start = offset + self.buckets.nbytes
+		self.mask = n_buckets - 1
+		self.n_features = n_features
+	
+	def get(self, feature, default = None):
+		'''return the weight row of a feature string or default if it is not in the map'''
+		start = self.strings_start
+		bucket = zlib.crc32(feature) & self.mask
+		while True:
+			row = int(self.buckets[bucket])
+			if row == -1:
+				return default
+			if self.buffer[start + int(self.offsets[row]):start + int(self.offsets[row + 1])] == feature:
+				return row
+			bucket = (bucket + 1) & self.mask
+	
+	def __contains__(self, feature):
+		return self.get(feature) is not None
+	
+	def __len__(self):
+		return self.n_features
+	
+	def iteritems(self):
+		start = self.strings_start
+		for row in range(self.n_features):
+			yield self.buffer[start + int(self.offsets[row]):start + int(self.offsets[row + 1])], row
+
 class Features:
 	'Class to map extracted features to the weight vectors'
-	def __init__(self):
+	def __init__(self, hash_bits = None):
 		self.mapping = {}
 		self.next_index = 0 # Next index for an unseen feature
 		self.frozen = False #Done training?
 		self.weights = []
-		self.instances = []
+		self.instances = InstanceStore() #training instances
+		self.compiled = {} #compiled feature key -> weight row, see extract_features
+		self.previous_compiled = {} #the generation of compiled keys before, see compile_features
+		self.atoms_generation = atom_generation # atom generation of the compiled keys
+		self.static_weights = None #copy of the weight rows followed by the static scores of a sentence, see get_static_rows
+		self.static_source = None #the weights static_weights was copied from
+		self.score_tolerance = None #see reserve_static_rows
+		self.hash_bits = None
+		if hash_bits:
+			self.set_hashing(hash_bits)
+	
+	def set_hashing(self, hash_bits):
+		'''switch to feature hashing: features are hashed into a fixed table of 2^hash_bits rows and no strings are stored'''
+		self.hash_bits = hash_bits
+		self.mapping = {}
+		self.clear_compiled()
+		self.next_index = 1 << hash_bits # the whole table is allocated up front
+	
+	def freeze(self):
+		'''method to freeze the feature map once the training instances are extracted, the compiled keys of the extraction are dropped'''
+		self.frozen = True
+		self.clear_compiled()
+	
+	def clear_compiled(self):
+		'''method to drop all compiled keys, they are compiled again from the feature map when they are next seen'''
+		self.compiled = {}
+		self.previous_compiled = {}
+		self.atoms_generation = atom_generation
 	
 	def extract_features(self, current_state, sentence):
 		'''method to extract basic features and update feature map and weight matrix'''
-		features = []
-		b_front = current_state.queue[0]
-		s_top = current_state.stack[-1]
-		b_front_pos =  sentence.pos[b_front] 
-		b_front_form =  sentence.forms[b_front] 			
-		s_top_pos = sentence.pos[s_top]
-		s_top_form = sentence.forms[s_top]
-		arcs = current_state.arcs	
-		dummy_form = "NULL"
-		dummy_pos = "NULL_POS"		
-				 
-		# Unigrams
-		features.append("s0form,pos=%s,%s" %(s_top_form, s_top_pos)) #stack top word form and POS
-		features.append("s0form=%s" %s_top_form) #stack top word form
-		features.append("s0pos=%s" %s_top_pos)	#stack top POS tag
-		
-		features.append("b0form,pos=%s,%s" %(b_front_form, b_front_pos)) #buffer front word form and POS
-		features.append("b0form=%s" %b_front_form) #buffer front word form
-		features.append("b0pos=%s" %b_front_pos)	#buffer front POS tag
-				
-		b_second_form = dummy_form
-		b_second_pos = dummy_pos
-		if len(current_state.queue) > 1:
-			b_second = current_state.queue[1]
-			b_second_form = sentence.forms[b_second]
-			b_second_pos = sentence.pos[b_second]
+		return self.lookup_features(self.get_feature_keys(current_state, sentence))
+	
+	def get_feature_keys(self, current_state, sentence):
+		'''method to build the compiled keys of all features of a configuration'''
+		# every feature is a compiled key: its template number followed by the atoms (interned forms, POS tags
+		# and distances) that fill in the template, the feature string is only formatted the first time a key is seen
+		form_atoms, pos_atoms = sentence.get_atoms() # token -1 (missing) maps to the NULL atoms at the end
+		queue = current_state.queue
+		stack = current_state.stack
+		b_front = queue[0]
+		s_top = stack[-1]
+		b_second = queue[1] if len(queue) > 1 else -1
+		b_third = queue[2] if len(queue) > 2 else -1
+		s_second = stack[-2] if len(stack) > 1 else -1
+		ldb_front = current_state.left_most[b_front] # left most dependent of buffer front
 		
-		features.append("b1form,pos=%s,%s" %(b_second_form, b_second_pos)) #buffer front word form and POS
-		features.append("b1form=%s" %b_second_form) #buffer front word form
-		features.append("b1pos=%s" %b_second_pos) #buffer 2nd item POS tag
+		b_front_pos = pos_atoms[b_front]
+		b_front_form = form_atoms[b_front]
+		s_top_pos = pos_atoms[s_top]
+		s_top_form = form_atoms[s_top]
+		b_second_pos = pos_atoms[b_second]
+		b_third_pos = pos_atoms[b_third]
+		ldbf_pos = pos_atoms[ldb_front]
+		hs_pos = pos_atoms[current_state.heads[s_top]]
+		left_most_pos = pos_atoms[current_state.left_most[s_top]]
+		right_most_pos = pos_atoms[current_state.right_most[s_top]]
 		
-		b_third_form = dummy_form
-		b_third_pos = dummy_pos
-		if len(current_state.queue) > 2:
-			b_third = current_state.queue[2]
-			b_third_form = sentence.forms[b_third]
-			b_third_pos = sentence.pos[b_third]
-			
-		features.append("b2form,pos=%s,%s" %(b_third_form, b_third_pos)) #buffer front word form and POS
-		features.append("b2form=%s" %b_third_form) #buffer front word form
-		features.append("b2pos=%s" %b_third_pos) #buffer 2nd item POS tag
-					
-		if len(current_state.stack) > 1:
-			features.append("s1pos=%s" %sentence.pos[current_state.stack[-2]]) #stack 2nd top item POS tag
+		# distance from stack to buffer (always positive since the stack holds the tokens before the buffer)
+		distance = b_front - s_top
+		if distance >= 10:
+			distance = DISTANCE_ATOMS[10]
 		else:
-			features.append("s1pos=%s" %dummy_pos) #stack 2nd top item POS tag
-				
-		buff_deps = get_dependents(b_front, arcs)
-		ldbf_pos = dummy_pos
-		if buff_deps:
-			left_most = min(buff_deps)
-			current_state.left_most[b_front] = left_most
-			ldbf_pos = sentence.pos[left_most]
-		
-		features.append("ldb0pos=%s"  %ldbf_pos) # POS of left most dependent of buffer front
+			distance = DISTANCE_ATOMS[distance]
 		
-		# Bigrams		
-		features.append("s0form,pos=%s,%s+b0form,pos=%s,%s" %(s_top_form, s_top_pos, b_front_form, b_front_pos)) #stack top and buffer front word form and POS
-		features.append("s0form,pos=%s,%s+b0form=%s" %(s_top_form, s_top_pos, b_front_form)) #stack top word form and POS and buffer front word
-		features.append("s0form=%s+b0form,pos=%s,%s" %(s_top_form, b_front_form, b_front_pos)) #stack top form and buffer front word form and POS
-		features.append("s0form,pos=%s,%s+b0pos=%s" %(s_top_form, s_top_pos, b_front_pos)) #stack top word form and POS and buffer POS 		
-		features.append("s0pos=%s+b0form,pos=%s,%s" %(s_top_pos, b_front_form, b_front_pos)) #stack top pos and buffer front word form, POS
-		features.append("s0form=%s+b0form=%s" %(s_top_form, b_front_form)) #stack top and buffer front word form
-		features.append("s0pos=%s+b0pos=%s" %(s_top_pos, b_front_pos)) #stack top and buffer front POS		
-		features.append("b0pos=%s+b1pos=%s" %(b_front_pos, b_second_pos)) # buffer front and second POS		
-		
-		# Trigrams			
-		features.append("b0pos=%s+b1pos=%s+b2pos=%s" %(b_front_pos, b_second_pos, b_third_pos)) #buffer front, second, 3rd POS		
-		features.append("s0pos=%s+b0pos=%s+b1pos=%s" %(s_top_pos, b_front_pos, b_second_pos)) #stack top, buffer front, buffer second POS	
+		# keys in the order of FEATURE_TEMPLATES
+		keys = ((0, s_top_form, s_top_pos), (1, s_top_form), (2, s_top_pos),
+			(3, b_front_form, b_front_pos), (4, b_front_form), (5, b_front_pos),
+			(6, form_atoms[b_second], b_second_pos), (7, form_atoms[b_second]), (8, b_second_pos),
+			(9, form_atoms[b_third], b_third_pos), (10, form_atoms[b_third]), (11, b_third_pos),
+			(12, pos_atoms[s_second]), (13, ldbf_pos),
+			(14, s_top_form, s_top_pos, b_front_form, b_front_pos), (15, s_top_form, s_top_pos, b_front_form),
+			(16, s_top_form, b_front_form, b_front_pos), (17, s_top_form, s_top_pos, b_front_pos),
+			(18, s_top_pos, b_front_form, b_front_pos), (19, s_top_form, b_front_form),
+			(20, s_top_pos, b_front_pos), (21, b_front_pos, b_second_pos),
+			(22, b_front_pos, b_second_pos, b_third_pos), (23, s_top_pos, b_front_pos, b_second_pos),
+			(24, hs_pos, s_top_pos, b_front_pos),
+			(25, s_top_pos, left_most_pos, b_front_pos), (26, s_top_pos, right_most_pos, b_front_pos), (27, s_top_pos, b_front_pos, ldbf_pos),
+			(28, s_top_form, distance), (29, s_top_pos, distance), (30, b_front_form, distance), (31, b_front_pos, distance),
+			(32, s_top_form, b_front_form, distance), (33, s_top_pos, b_front_pos, distance))
+		return keys
+	
+	def lookup_features(self, keys):
+		'''method to turn compiled keys into a feature vector of weight rows'''
+		if self.atoms_generation != atom_generation: #the atoms of the compiled keys were dropped
+			self.clear_compiled()
+		fvector = map(self.compiled.get, keys)
+		if None in fvector: #some of the features are seen for the first time
+			self.compile_features(keys, fvector)
+		if -1 in fvector: #drop features that were not seen in training (frozen mode only)
+			fvector = [index for index in fvector if index != -1]
+		return fvector
+	
+	def reserve_static_rows(self, n_rows):
+		'''method to make room for n_rows static score rows after a float64 copy of the weight rows, returns the extended matrix'''
+		# the static scores of a sentence are gathered from the same matrix as the weight rows of the other templates,
+		# so a parser step scores all its features with one take, the copy is only made again when self.weights is
+		# replaced or a sentence needs more rows
+		static_weights = self.static_weights
+		if static_weights is None or self.static_source is not self.weights or len(static_weights) - len(self.weights) < n_rows:
+			static_weights = np.empty((len(self.weights) + max(n_rows, STATIC_ROWS), 4))
+			static_weights[:len(self.weights)] = self.weights
+			self.static_weights = static_weights
+			self.static_source = self.weights
+			# every score adds up at most len(FEATURE_TEMPLATES) weights, so each summation order is off the exact sum by
+			# less than len * eps * len * max|w| (eps = 2^-52), the tolerance leaves a wide margin on top of twice that
+			max_weight = float(np.abs(self.weights).max()) if len(self.weights) else 0.0
+			self.score_tolerance = 1e-12 * len(FEATURE_TEMPLATES) * max_weight
+		return static_weights
+	
+	def get_static_rows(self, sentence):
+		'''method to score the single-token templates of every slot for every token of a sentence once, returns the row of the first static score'''
+		# row first_row + slot * n + token of static_weights holds the 4-way score of the templates in STATIC_SLOTS[slot]
+		# for that token, the last row of every slot (token -1) is the missing token
+		if self.atoms_generation != atom_generation: #the atoms of the compiled keys were dropped
+			self.clear_compiled()
+		form_atoms, pos_atoms = sentence.get_atoms()
+		n = len(form_atoms)
+		static_weights = self.reserve_static_rows(len(STATIC_SLOTS) * n)
+		keys = []
+		for templates in STATIC_SLOTS:
+			for template in templates:
+				if FEATURE_TEMPLATES[template].count("%s") == 2: #form and POS
+					keys.extend((template, form, pos) for form, pos in zip(form_atoms, pos_atoms))
+				elif "form" in FEATURE_TEMPLATES[template]:
+					keys.extend((template, form) for form in form_atoms)
+				else:
+					keys.extend((template, pos) for pos in pos_atoms)
+		indexes = map(self.compiled.get, keys)
+		if None in indexes:
+			self.compile_features(keys, indexes)
+		indexes = np.array(indexes).reshape(STATIC_TEMPLATE_COUNT, n)
+		rows = static_weights.take(indexes, axis=0) # template * token * 4
+		rows[indexes == -1] = 0 #unseen features add nothing
+		first_row = len(self.weights)
+		template = 0
+		for slot, templates in enumerate(STATIC_SLOTS):
+			static_weights[first_row + slot * n:first_row + (slot + 1) * n] = rows[template:template + len(templates)].sum(axis=0)
+			template += len(templates)
+		return first_row
+	
+	def get_slot_rows(self, current_state, first_row, n):
+		'''method to return the static score rows of the tokens in the six single-token slots of a configuration'''
+		queue = current_state.queue
+		stack = current_state.stack
+		b_front = queue[0]
+		return [first_row + stack[-1], first_row + n + b_front,
+			first_row + 2 * n + (queue[1] if len(queue) > 1 else -1) % n, first_row + 3 * n + (queue[2] if len(queue) > 2 else -1) % n,
+			first_row + 4 * n + (stack[-2] if len(stack) > 1 else -1) % n, first_row + 5 * n + current_state.left_most[b_front] % n]
+	
+	def compile_features(self, keys, fvector):
+		'''method to format the feature strings of new compiled keys once and store their weight rows (-1 = unseen) in place of None'''
+		# the cache is kept in two generations of at most COMPILED_CACHE_SIZE keys, when the current one is full it
+		# replaces the one before and keys that are still in use move back from there, so a long training or
+		# parsing run does not keep every key it ever saw
+		compiled = self.compiled
+		if len(compiled) >= COMPILED_CACHE_SIZE:
+			self.previous_compiled = compiled
+			self.compiled = compiled = {}
+		previous_compiled = self.previous_compiled
+		for position, index in enumerate(fvector):
+			if index is not None:
+				continue
+			key = keys[position]
+			index = previous_compiled.get(key)
+			if index is not None:
+				compiled[key] = index
+				fvector[position] = index
+				continue
+			if len(key) == 2:
+				feature = FEATURE_TEMPLATES[key[0]] % atom_strings[key[1]]
+			elif len(key) == 3:
+				feature = FEATURE_TEMPLATES[key[0]] % (atom_strings[key[1]], atom_strings[key[2]])
+			elif len(key) == 4:
+				feature = FEATURE_TEMPLATES[key[0]] % (atom_strings[key[1]], atom_strings[key[2]], atom_strings[key[3]])
+			else:
+				feature = FEATURE_TEMPLATES[key[0]] % (atom_strings[key[1]], atom_strings[key[2]], atom_strings[key[3]], atom_strings[key[4]])
 			
-		# POS of head of stack top			
-		heads = get_head(s_top, arcs)
-		hs_pos = dummy_pos
-		if heads:
-			hs_pos = sentence.pos[heads[0]]
-		
-		features.append("hs0pos=%s+s0pos=%s+b0pos=%s" %(hs_pos, s_top_pos, b_front_pos)) #head of stack top, stack top, buffer front POS	
-				
-		stack_deps = get_dependents(s_top, arcs)
-		left_most_pos = dummy_pos
-		right_most_pos = dummy_pos
-		if stack_deps:
-			left_most_dep = min(stack_deps)
-			right_most_dep = max(stack_deps)
-			current_state.left_most[s_top] = left_most_dep
-			current_state.right_most[s_top] = right_most_dep
-			left_most_pos = sentence.pos[left_most_dep]
-			right_most_pos = sentence.pos[right_most_dep]
-		
-		features.append("s0pos=%s+lds0pos=%s+b0pos=%s" %(s_top_pos, left_most_pos, b_front_pos))
-		features.append("s0pos=%s+rds0pos=%s+b0pos=%s" %(s_top_pos, right_most_pos, b_front_pos))		
-		features.append("s0pos=%s+b0pos=%s+ldb0pos=%s" %(s_top_pos, b_front_pos, ldbf_pos))
-		
-		# distance features
-		distance = b_front - s_top  #distance from stack to buffer
-		distance_str = str(distance)
-		
-		if distance >= 10:
-			distance_str = "10+"
-		
-		features.append("s0form,d=%s,%s" %(s_top_form, distance_str)) #stack top word form and distance
-		features.append("s0pos,d=%s,%s" %(s_top_pos, distance_str)) #stack top POS and distance
-		features.append("b0form,d=%s,%s" %(b_front_form, distance_str)) #buffer front word form and distance
-		features.append("b0pos,d=%s,%s" %(b_front_pos, distance_str))	#buffer front POS tag and distance
-		features.append("s0form=%s+b0form,d=%s,%s" %(s_top_form, b_front_form ,distance_str)) #stack top word form and buffer front word form + distance
-		features.append("s0pos=%s+b0pos,d=%s,%s" %(s_top_pos, b_front_pos ,distance_str)) #stack top POS and buffer front POS + distance
-				
-		fvector = []
-		for feat in features:
-					
-			if self.frozen: #test time parsing
-				if feat in self.mapping:
-					fvector.append(self.mapping[feat])				
-			else:												
+			if self.frozen and not self.hash_bits: #test time parsing
+				index = self.mapping.get(feature, -1)
+			else:
 				#add feature mapping if new
-				findex = self.update_map(feat)
-				fvector.append(findex)								
-		
-		return fvector
+				index = self.update_map(feature)
+			compiled[key] = index
+			fvector[position] = index
 		
 	def update_map(self, feature):
+		if self.hash_bits:
+			# crc32 is stable across processes and platforms, unlike hash()
+			return zlib.crc32(feature) & (self.next_index - 1)
 		if feature not in self.mapping:
 			self.mapping[feature]= self.next_index #add new mapping
 			self.next_index += 1 
 		return self.mapping[feature]
 		
-	def save_mapping(self, language):
-		with open("feature-map-%s" % language, 'wb') as fp:
-			pickle.dump(self.mapping, fp, -1) # -1 = pickle.HIGHEST_PROTOCOL
-		  
-	def save_weights(self, language):
-		with open("weights-%s" % language, 'wb') as fp:
-			pickle.dump(self.weights, fp, -1) # -1 = pickle.HIGHEST_PROTOCOL
+	def save_model(self, language, model_file = None, weight_format = "float64"):
+		'''method to write the feature map and the weights to one binary model file that load_model can memory-map'''
+		weights, scale = quantize_weights(self.weights, weight_format)
+		if self.hash_bits: #hashed models only need the table size
+			features = []
+		else:
+			features = [None] * len(self.mapping) # feature strings by weight row
+			for feature, index in self.mapping.iteritems():
+				features[index] = feature
 		
+		offsets = np.zeros(len(features) + 1, dtype="<u8")
+		offsets[1:] = np.cumsum([len(feature) for feature in features])
+		n_buckets = 2
+		while n_buckets < 2 * len(features): #keep the table at most half full
+			n_buckets *= 2
+		buckets = np.full(n_buckets, -1, dtype="<i4")
+		mask = n_buckets - 1
+		for row, feature in enumerate(features):
+			bucket = zlib.crc32(feature) & mask
+			while buckets[bucket] != -1:
+				bucket = (bucket + 1) & mask
+			buckets[bucket] = row
+		
+		strings = "".join(features)
+		header = MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, FEATURE_VERSION, self.hash_bits or 0, WEIGHT_FORMATS.index(weight_format),
+			len(weights), len(features), n_buckets, len(strings), scale)
+		model_file = model_file or "model-%s" % language
+		with atomic_write(model_file) as fp:
+			fp.write(header)
+			fp.write(weights.tobytes())
+			fp.write("\0" * (-weights.nbytes % 8)) # keeps the offsets aligned
+			fp.write(offsets.tobytes())
+			fp.write(buckets.tobytes())
+			fp.write(strings)
+	
+	def load_model(self, language, model_file = None):
+		'''method to memory-map a binary model file, the weights and the feature map are read in place and shared between processes'''
+		if model_file is None:
+			model_file = "model-%s" % language
+		elif not os.path.exists(model_file): #only the default model file falls back to the pickled model
+			raise IOError("No model file %s" % model_file)
+		if not os.path.exists(model_file) and os.path.exists("weights-%s" % language): #model in the old pickle format
+			# stderr, so the notice never ends up in predictions written to stdout
+			print >> sys.stderr, "No %s found, loading the pickled model (convert it with convert_model.py for faster loading)" %model_file
+			self.load_mapping(language)
+			self.load_weights(language)
+			return
+		with open(model_file, 'rb') as fp:
+			buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) #the mapping stays valid after the file is closed
+		magic, model_version, feature_version, hash_bits, weight_format, n_rows, n_features, n_buckets, strings_size, scale = MODEL_HEADER.unpack_from(buffer)
+		if magic != MODEL_MAGIC or model_version not in [1, MODEL_VERSION]:
+			raise ValueError("%s is not a model file of version %i" % (model_file, MODEL_VERSION))
+		if feature_version != FEATURE_VERSION:
+			raise ValueError("%s was trained with feature templates of version %i, this parser uses version %i" % (model_file, feature_version, FEATURE_VERSION))
+		
+		weight_format = WEIGHT_FORMATS[weight_format]
+		weights = np.frombuffer(buffer, dtype=WEIGHT_DTYPES[weight_format], count=n_rows * 4, offset=MODEL_HEADER.size).reshape(n_rows, 4)
+		if hash_bits:
+			self.set_hashing(hash_bits)
+		else:
+			weights_size = weights.nbytes + (-weights.nbytes % 8)
+			self.mapping = FeatureTable(buffer, MODEL_HEADER.size + weights_size, n_features, n_buckets)
+			self.next_index = n_features
+			self.clear_compiled() #rebuilt lazily from the string-keyed map
+		if weight_format == "float64":
+			self.weights = weights # read-only view of the file
+		else: #quantized weights are expanded into a float64 copy
+			self.weights = weights.astype(np.float64)
+			self.weights *= scale
+	
+	def unfreeze(self):
+		'''method to make a loaded model trainable again, new features get fresh weight rows'''
+		if not self.hash_bits and not isinstance(self.mapping, dict): #the map of a model file is read-only
+			self.mapping = dict(self.mapping.iteritems())
+		# keys that were compiled as unseen (-1) while the map was frozen have to get rows now
+		self.compiled = dict((key, index) for key, index in self.compiled.iteritems() if index != -1)
+		self.previous_compiled = {}
+		self.weights = np.array(self.weights, dtype=np.float64) # writable copy of the weights of the model file
+		self.frozen = False
+	
+	def prune(self, min_weight = 0.0, counts = None, min_count = 0):
+		'''method to drop the features whose weights are all within min_weight of zero or that occur in fewer than min_count training instances, returns the number of dropped features'''
+		# the remaining features are renumbered in their old order, dropping all-zero rows (min_weight = 0) leaves
+		# every score and so every prediction exactly as it was
+		if self.hash_bits:
+			raise ValueError("hashed models can not be pruned, their weight rows are addressed by the hash of the features")
+		keep = np.abs(self.weights).max(axis=1) > min_weight
+		if counts is not None and min_count > 1:
+			keep &= counts >= min_count
+		new_rows = np.cumsum(keep) - 1
+		self.mapping = dict((feature, int(new_rows[row])) for feature, row in self.mapping.iteritems() if keep[row])
+		self.weights = np.ascontiguousarray(self.weights[keep])
+		self.next_index = len(self.weights)
+		self.clear_compiled()
+		return int(len(keep) - keep.sum())
+	
+	def save_instances(self, cache_file, source_file):
+		'''method to write the feature map and the training instances to a binary cache for the source file'''
+		instances = self.instances.freeze()
+		cache = {"version": FEATURE_VERSION,
+			"source": get_source_key(source_file),
+			"hash_bits": self.hash_bits,
+			"mapping": self.mapping,
+			"next_index": self.next_index,
+			"transitions": instances.transitions,
+			"offsets": instances.offsets,
+			"features": instances.features}
+		with atomic_write(cache_file) as fp:
+			pickle.dump(cache, fp, -1) # -1 = pickle.HIGHEST_PROTOCOL
+	
+	def load_instances(self, cache_file, source_file):
+		'''method to load the feature map and training instances from a cache, returns False if it is missing or out of date'''
+		if not os.path.exists(cache_file):
+			return False
+		with open(cache_file, 'rb') as fp:
+			cache = pickle.load(fp)
+		if cache["version"] != FEATURE_VERSION or cache["source"] != get_source_key(source_file) or cache["hash_bits"] != self.hash_bits:
+			return False
+		self.mapping = cache["mapping"]
+		self.next_index = cache["next_index"]
+		self.clear_compiled()
+		self.instances = InstanceStore(cache["transitions"], cache["offsets"], cache["features"])
+		return True
+	
 	def load_mapping(self, language):
 		with open("feature-map-%s" % language, 'rb') as fp:
-			self.mapping = pickle.load(fp) 
+			mapping = pickle.load(fp) 
+		if isinstance(mapping, int): #model was trained in hashing mode
+			self.set_hashing(mapping)
+		else:
+			self.mapping = mapping
+			self.clear_compiled() #rebuilt lazily from the string-keyed map
 			 
 	def load_weights(self, language):
 		with open("weights-%s" % language, 'rb') as fp:
-			self.weights =  pickle.load(fp)
+			self.weights = np.ascontiguousarray(pickle.load(fp), dtype=np.float64) # n * 4 weight matrix
 					
 class Guide:
 	'Classifier or Guide to calculate scores and predict transitions'
 	
 	def predict_transition(self, fvector, weight_matrix, legal_transitions=[0,1,2,3]):  #pass by refrence since lists and classes are mutable
-		scores = {transition: 0.0 for transition in legal_transitions}
 		prediction = 0
 		try:
-			
-			for index in fvector:
-				for tr in legal_transitions:
-					scores[tr] += weight_matrix[index][tr] #score for current transition		
-								
-			prediction = max(scores,key=scores.get) #highest scored transiton is the one we will predict						
+			# gather the rows of all active features and add them up in one go (rows are summed in fvector order)
+			scores = weight_matrix[fvector].sum(axis=0)
+			# mask illegal transitions so they can never win
+			masked_scores = np.full(4, -np.inf)
+			masked_scores[legal_transitions] = scores[legal_transitions]
+			prediction = int(masked_scores.argmax()) #highest scored transiton is the one we will predict (ties go to the lowest code)
 						
 		except Exception as exc:
 			print("Unexpected error: ", exc)	
 		return prediction	
 	
-	def update_weights(self, instance, predicted_transition, weight_matrix, cache_weights, steps):
-		for index in instance.fvector:
-			weight_matrix[index][instance.transition] += 1.0  #add 1 to the correct transition
-			weight_matrix[index][predicted_transition] -= 1.0	#subtract 1 from the wrong prediction
-			cache_weights[index][instance.transition] += steps  #add steps to the correct transition
-			cache_weights[index][predicted_transition] -= steps	#subtract steps from the wrong prediction	
+	def predict_transition_static(self, fvector, static_weights, legal_transitions, tolerance):
+		'''predict from the rows of the multi-token features and the static scores of the six slots, returns None when the call is too close'''
+		scores = static_weights.take(fvector, axis=0).sum(axis=0).tolist()
+		prediction = legal_transitions[0]
+		for tr in legal_transitions[1:]:
+			if scores[tr] > scores[prediction]:
+				prediction = tr
+		runner_up = max([scores[tr] for tr in legal_transitions if tr != prediction])
+		# the scores are added up in a different order than in predict_transition, so a (near) tie could come
+		# out the other way there, leave those to predict_transition
+		if scores[prediction] - runner_up <= tolerance:
+			return None
+		return prediction
+	
+	def predict_transitions(self, fvectors, weight_matrix, legal_transitions):
+		'''predict the transitions of a batch of configurations with one gather and one sum for the whole batch'''
+		# add -inf to the scores of illegal transitions so they can never win (ties go to the lowest code)
+		masks = np.array([self.get_transition_mask(legal) for legal in legal_transitions])
+		return (self.score_transitions(fvectors, weight_matrix) + masks).argmax(axis=1).tolist()
+	
+	def score_transitions(self, fvectors, weight_matrix):
+		'''return the batch * 4 scores of the transitions of a batch of configurations'''
+		# the feature vectors are padded to the same length with row 0, the padding rows are multiplied by 0 so every
+		# configuration adds up the same values in the same order as predict_transition and gets the same scores
+		lengths = [len(fvector) for fvector in fvectors]
+		width = max(lengths)
+		index = np.array([fvector + [0] * (width - len(fvector)) for fvector in fvectors], dtype=np.intp)
+		rows = weight_matrix[index] # batch * width * 4
+		rows *= (np.arange(width) < np.array(lengths)[:, np.newaxis])[:, :, np.newaxis]
+		return rows.sum(axis=1)
+	
+	def get_transition_mask(self, legal_transitions):
+		'''return a row that is 0 for legal and -inf for illegal transitions'''
+		mask = [-np.inf] * 4
+		for tr in legal_transitions:
+			mask[tr] = 0.0
+		return mask
+	
+	def update_weights(self, fvector, transition, predicted_transition, weight_matrix, cache_weights, steps):
+		# np.add.at applies repeated indexes once per occurrence (hashed features can collide inside one vector)
+		np.add.at(weight_matrix, (fvector, transition), 1.0)  #add 1 to the correct transition
+		np.add.at(weight_matrix, (fvector, predicted_transition), -1.0)	#subtract 1 from the wrong prediction
+		np.add.at(cache_weights, (fvector, transition), steps)  #add steps to the correct transition
+		np.add.at(cache_weights, (fvector, predicted_transition), -steps)	#subtract steps from the wrong prediction
 			
+	def update_histories(self, gold_history, predicted_history, weight_matrix, cache_weights, steps):
+		'''reward the transitions of a gold history and penalize those of a predicted one from the step where they part'''
+		# the histories of the beam items share the nodes of their common steps, those would add and subtract the
+		# same features, so only the nodes after the last shared one are updated
+		gold_nodes = []
+		while gold_history is not None:
+			gold_nodes.append(gold_history)
+			gold_history = gold_history[0]
+		shared = set(id(node) for node in gold_nodes)
+		predicted_nodes = []
+		while predicted_history is not None and id(predicted_history) not in shared:
+			predicted_nodes.append(predicted_history)
+			predicted_history = predicted_history[0]
+		if predicted_history is not None: #drop the shared nodes from the gold side too
+			gold_nodes = gold_nodes[:[id(node) for node in gold_nodes].index(id(predicted_history))]
+		for nodes, sign in [(gold_nodes, 1.0), (predicted_nodes, -1.0)]:
+			if not nodes:
+				continue
+			fvector = np.array(list(chain.from_iterable(node[1] for node in nodes)), dtype=np.intp)
+			transitions = np.repeat([node[2] for node in nodes], [len(node[1]) for node in nodes])
+			np.add.at(weight_matrix, (fvector, transitions), sign)
+			np.add.at(cache_weights, (fvector, transitions), sign * steps)
+	
 	def get_legal_transitions(self, current_state):
 		legal_tr = [0,2]
-		arcs = current_state.arcs
 		stack_top = current_state.stack[-1]
-		if self.can_left_arc(stack_top, arcs):
+		if self.can_left_arc(stack_top, current_state):
 			legal_tr.append(1)
-		elif self.can_reduce(stack_top, arcs):
+		elif self.can_reduce(stack_top, current_state):
 			legal_tr.append(3)
 		
 		return legal_tr
 			
-	def can_left_arc(self, stack_top, arcs):
+	def can_left_arc(self, stack_top, current_state):
 		
 		if stack_top == 0: #stack top is root
 			return False
 		
-		head_count = len([tup[0] for tup in arcs if tup[1] == stack_top])
-		
-		if head_count == 0: #if stack top has no head
+		if current_state.heads[stack_top] == -1: #if stack top has no head
 			return  True
 		else: 
 			return False	
 				
-	def can_reduce(self, stack_top, arcs):
+	def can_reduce(self, stack_top, current_state):
 		result = False
-		head_count = len([tup[0] for tup in arcs if tup[1] == stack_top])
 		
-		if head_count:
+		if current_state.heads[stack_top] != -1: #if stack top has a head
 			result = True
-		return result	
-			
+		return result
+
+class Perceptron:
+	'Averaged perceptron training engine working on preallocated n * 4 weight matrices'
+	def __init__(self, n_features):
+		self.weights = np.zeros((n_features, 4)) # current weights
+		self.cache_weights = np.zeros((n_features, 4)) # updates weighted by the step they were made at (used for averaging)
+		self.steps = 0.0
+		self.guide = Guide()
+
+	def train_epoch(self, instances, order):
+		'''method to run one perceptron pass over the instances of a store in the order of a permutation, returns the number of mistakes'''
+		transitions = instances.transitions
+		offsets = instances.offsets
+		features = instances.features
+		mistakes = 0
+		for index in order:
+			self.steps += 1
+			fvector = features[offsets[index]:offsets[index + 1]]
+			predicted_tr = self.guide.predict_transition(fvector, self.weights)
+			if predicted_tr != transitions[index]: #compare prediction to correct transition
+				mistakes += 1
+				self.guide.update_weights(fvector, transitions[index], predicted_tr, self.weights, self.cache_weights, self.steps) #update weights
+		return mistakes
+
+	def train_beam_epoch(self, sentences, gold_transitions, order, feats, beam_size):
+		'''method to run one early-update pass of the beam decoder over the sentences in the order of a permutation, returns the number of updates'''
+		# one step per sentence: the beam search stops where the gold sequence falls out of the beam, or at the
+		# end if the best item is not the gold one, and the perceptron is updated towards the gold sequence
+		feats.weights = self.weights # the beam search scores with the weights of the model
+		mistakes = 0
+		for index in order:
+			self.steps += 1
+			predicted, gold = beam_search(sentences[index], feats, self.guide, beam_size, gold_transitions[index])
+			if predicted is not gold:
+				mistakes += 1
+				self.guide.update_histories(gold.history, predicted.history, self.weights, self.cache_weights, self.steps)
+		return mistakes
+
+	def average(self):
+		'''method to average the weights in place (w - cache/steps), cache_weights is used up in the process'''
+		self.cache_weights *= (1/self.steps)
+		self.weights -= self.cache_weights
+		return self.weights
+
+	def get_averaged(self):
+		'''method to return a copy of the averaged weights and go on training, same as average without touching the matrices'''
+		averaged = self.cache_weights * (1/self.steps)
+		np.subtract(self.weights, averaged, out=averaged)
+		return averaged
+
+def quantize_weights(weights, weight_format):
+	'''return the weights in a weight format for saving and the scale that turns them back into float64'''
+	if weight_format == "float64":
+		return np.ascontiguousarray(weights, dtype="<f8"), 1.0
+	if weight_format == "float16":
+		if len(weights) and np.abs(weights).max() > np.finfo(np.float16).max:
+			raise ValueError("the weights are too large for float16, use int8")
+		return np.ascontiguousarray(weights, dtype="<f2"), 1.0
+	if weight_format == "int8": #one scale for the whole matrix, the largest weight becomes +-127
+		max_weight = float(np.abs(weights).max()) if len(weights) else 0.0
+		scale = max_weight / 127 or 1.0
+		return np.round(np.asarray(weights) / scale).astype("i1"), scale
+	raise ValueError("unknown weight format %s, use one of %s" % (weight_format, ", ".join(WEIGHT_FORMATS)))
+
+def get_int64_array(buffer):
+	'''return the numbers of an array('l') buffer as an int64 numpy array'''
+	# python 2 arrays have no 64 bit type code, 'l' is a C long: 8 bytes on 64 bit linux and mac but 4 on windows,
+	# so the buffer is read as C longs and only copied where they are shorter than int64
+	return np.frombuffer(buffer, dtype=np.dtype('l')).astype(np.int64, copy=False)
+
+def get_shared_array(shape):
+	'''return a zeroed float64 array in anonymous shared memory that forked processes can write to'''
+	size = int(np.prod(shape)) * 8
+	return np.frombuffer(mmap.mmap(-1, max(size, 1)), dtype=np.float64, count=size // 8).reshape(shape)
+
+def train_shard(task):
+	'''run one perceptron epoch over a shard of the instances in a worker process, starting from the mixed weights'''
+	instances, mixed_weights, shard_weights, shard_sums = train_job
+	slot, order = task
+	perceptron = Perceptron(len(mixed_weights))
+	perceptron.weights += mixed_weights
+	mistakes = perceptron.train_epoch(instances, order)
+	# the weights the shard ended with and the sum of the weights it predicted with at each of its steps
+	# (steps * w - cache, the same cache trick as Perceptron.average)
+	shard_weights[slot] = perceptron.weights
+	perceptron.cache_weights *= -1
+	perceptron.cache_weights += perceptron.steps * perceptron.weights
+	shard_sums[slot] = perceptron.cache_weights
+	return mistakes
+
+def train_mixed(instances, n_features, workers, epochs, order = None, instrumentation = None, initial_weights = None, end_epoch = None, resume = None):
+	'''train an averaged perceptron with iterative parameter mixing and return the averaged weights'''
+	# every epoch the shuffled instances are split into one shard per worker, each worker runs a perceptron epoch
+	# over its shard starting from the mixed weights, and the weights of the shards are averaged into the new
+	# mixed weights. The result is the average of the weights of all steps of all shards over all epochs.
+	# The weight matrices live in shared memory, so only shard numbers and orders go through the pool.
+	# end_epoch(epoch, mixed weights, weight sum) is called with the state of the training after every epoch,
+	# training stops when it returns True. resume = (first epoch, mixed weights, weight sum) continues a run
+	# from the state it had at the end of the epoch before.
+	global train_job
+	if order is None:
+		order = np.arange(len(instances), dtype=np.int32)
+	mixed_weights = get_shared_array((n_features, 4))
+	if initial_weights is not None: #continue from the weights of a saved model, new features start at zero
+		mixed_weights[:len(initial_weights)] = initial_weights
+	shard_weights = get_shared_array((workers, n_features, 4))
+	shard_sums = get_shared_array((workers, n_features, 4))
+	weight_sum = np.zeros((n_features, 4))
+	first_epoch = 0
+	if resume is not None:
+		first_epoch, resumed_weights, resumed_sum = resume
+		mixed_weights[:] = resumed_weights
+		weight_sum += resumed_sum
+	trained_epochs = max(epochs, first_epoch)
+	train_job = (instances, mixed_weights, shard_weights, shard_sums)
+	pool = multiprocessing.Pool(workers)
+	try:
+		for k in range(first_epoch, epochs):
+			start = time.time()
+			if k > 0:
+				random.shuffle(order)
+			shards = np.array_split(order, workers)
+			mistakes = pool.map(train_shard, list(enumerate(shards)))
+			mixed_weights[:] = shard_weights.mean(axis=0) #uniform mixing
+			weight_sum += shard_sums.sum(axis=0)
+			if instrumentation is not None:
+				instrumentation.record_epoch(k, time.time() - start, len(order), sum(mistakes))
+			trained_epochs = k + 1
+			if end_epoch is not None and end_epoch(k, mixed_weights, weight_sum):
+				break
+	finally:
+		pool.terminate()
+		pool.join()
+		train_job = None
+	weight_sum *= 1.0 / (trained_epochs * len(order))
+	return weight_sum
+
+def get_atom(string):
+	'''intern a form or POS tag and return its atom'''
+	atom = atom_ids.get(string)
+	if atom is None:
+		with atom_lock: #another thread may have added it in the meantime
+			atom = atom_ids.get(string)
+			if atom is None:
+				atom_strings.append(string) # the string is in place before any thread can look up its atom
+				atom = len(atom_strings) - 1
+				atom_ids[string] = atom
+	return atom
+
+def trim_atoms(shared = False):
+	'''drop the atoms of all forms and POS tags once there are more than MAX_ATOMS, returns True if they were dropped'''
+	# sentences, corpora and compiled keys see the new atom generation and intern their strings again when they
+	# are next used. With shared the atoms are only dropped when no other thread of the process is parsing
+	global atom_generation
+	if len(atom_strings) <= MAX_ATOMS:
+		return False
+	with atom_lock:
+		if shared and active_parses > 1:
+			return False
+		for string in atom_strings[fixed_atoms:]:
+			del atom_ids[string]
+		del atom_strings[fixed_atoms:]
+		atom_generation += 1
+	return True
+
+@contextmanager
+def atomic_write(path):
+	'''open a temporary file next to path for writing and move it over path once it is completely on disk'''
+	# a crash at any point leaves either the old file or the new one behind, never a part of the new one
+	temp_path = path + ".tmp"
+	try:
+		with open(temp_path, 'wb') as fp:
+			yield fp
+			fp.flush()
+			os.fsync(fp.fileno())
+		os.rename(temp_path, path)
+	finally:
+		if os.path.exists(temp_path): #the write failed
+			os.remove(temp_path)
+
+def get_source_key(source_file):
+	'''identify a version of an input file by its path, size and modification time'''
+	return (os.path.abspath(source_file), os.path.getsize(source_file), os.path.getmtime(source_file))
+
 def add_arc(current_state, new_arc):
-	if new_arc not in current_state.arcs:
+	head, dependent = new_arc
+	if current_state.heads[dependent] != head: #every token has a single head, so this is the same as checking the arc list
 		current_state.arcs.append(new_arc)
+		current_state.heads[dependent] = head
+		current_state.dependent_counts[head] += 1
+		# keep the left-most and right-most dependents of the head up to date
+		if current_state.left_most[head] == -1 or dependent < current_state.left_most[head]:
+			current_state.left_most[head] = dependent
+		if dependent > current_state.right_most[head]:
+			current_state.right_most[head] = dependent
 	return current_state	
 	
 def do_left_arc(current_state):	
@@ -315,11 +1118,332 @@ def do_shift(current_state):
 	current_state.stack.append(current_state.queue[0])
 	# remove front of buffer since it's in stack now
 	current_state.queue.popleft()
-	return current_state				
+	return current_state
+
+def parse_sentence(current_sentence, feats, guide, static_scores = False):
+	'''greedily parse a sentence with the trained model and store the predicted heads in it'''
+	current_state = State(len(current_sentence.forms)) # create a start state for the sentence
+	if static_scores: #score the single-token templates once for the whole sentence
+		first_row = feats.get_static_rows(current_sentence)
+		n = len(current_sentence.forms) + 1 # static rows per slot
+	
+	while current_state.queue:
+		legal_transitions = guide.get_legal_transitions(current_state)
+		if static_scores:
+			keys = feats.get_feature_keys(current_state, current_sentence)
+			fvector = feats.lookup_features(keys[STATIC_TEMPLATE_COUNT:]) + feats.get_slot_rows(current_state, first_row, n)
+			tr_code = guide.predict_transition_static(fvector, feats.static_weights, legal_transitions, feats.score_tolerance)
+			if tr_code is None: #too close to call, score all features the usual way
+				tr_code = guide.predict_transition(feats.lookup_features(keys), feats.weights, legal_transitions)
+		else:
+			fvector = feats.extract_features(current_state, current_sentence) # extract featuress
+			tr_code = guide.predict_transition(fvector, feats.weights, legal_transitions)		
+		tr = Transition(tr_code)
+		current_state = tr.apply_transition(current_state) #create new state
+
+	#final state reached, attach heads to headless tokens.
+	attach_heads(current_sentence, current_state)
+	return current_sentence
+
+def parse_memo(sentences, feats, guide, memo):
+	'''greedily parse a list of sentences like parse_sentence, with the configurations of an earlier parse scored from a ParseMemo, returns the ParseMemo of this parse'''
+	# the scores of all configurations of the memo are computed with one gather up front, the walk through a
+	# known configuration is then only a comparison of four numbers, new configurations are scored the usual way.
+	# The configurations of this parse are copied to a new memo, the ones no longer reached are dropped, so the
+	# memo never holds more than one parse and the gather does not grow from one epoch to the next
+	scores = memo.get_scores(feats.weights)
+	next_memo = ParseMemo(len(sentences))
+	for index, current_sentence in enumerate(sentences):
+		current_state = State(len(current_sentence.forms))
+		node = memo.starts[index]
+		link = None # (node of the new memo, transition code) that led to the current configuration
+		while current_state.queue:
+			legal_transitions = sorted(guide.get_legal_transitions(current_state)) # max keeps the first (lowest) of equal scores
+			if node == -1: #not reached before
+				fvector = feats.extract_features(current_state, current_sentence)
+				tr_code = guide.predict_transition(fvector, feats.weights, legal_transitions)
+			else:
+				fvector = memo.get_features(node)
+				tr_code = max(legal_transitions, key=scores[node].__getitem__)
+			current_state = Transition(tr_code).apply_transition(current_state)
+			link = (next_memo.add(fvector, index, link), tr_code)
+			node = memo.children.get((node, tr_code), -1)
+		attach_heads(current_sentence, current_state)
+	return next_memo
+
+def beam_search(current_sentence, feats, guide, beam_size, gold_transitions = None):
+	'''search the transition sequences of a sentence with a beam, returns the best item and, given the gold transitions, the gold item'''
+	# every step the configurations of all unfinished items are scored with one gather for the whole beam, items
+	# whose configurations have the same feature keys (they only differ in arcs no template looks at) share one
+	# feature vector and one row of scores. Finished items stay in the beam with their score until all items are
+	# finished. The candidates are ranked by their total score, then by the score of their last transition, then
+	# by the position of their item and their transition code, so a beam of 1 takes the same transitions as
+	# parse_sentence. With gold transitions the search stops as soon as no item of the beam is gold any more
+	# (early update) and returns the gold item that fell out.
+	beam = [BeamItem(0.0, State(len(current_sentence.forms)), None, gold_transitions is not None)]
+	step = 0
+	while True:
+		positions = [position for position, item in enumerate(beam) if item.state.queue]
+		if not positions:
+			break
+		rows = {} # feature keys -> row of the scores
+		fvectors = []
+		beam_rows = [None] * len(beam)
+		for position in positions:
+			keys = feats.get_feature_keys(beam[position].state, current_sentence)
+			row = rows.get(keys)
+			if row is None:
+				row = rows[keys] = len(fvectors)
+				fvectors.append(feats.lookup_features(keys))
+			beam_rows[position] = row
+		masks = [guide.get_transition_mask(guide.get_legal_transitions(beam[position].state)) for position in positions]
+		# scores of the transitions of every item, a finished item only has a transition 0 of score 0 that keeps it
+		local = np.tile([0.0, -np.inf, -np.inf, -np.inf], (len(beam), 1))
+		local[positions] = guide.score_transitions(fvectors, feats.weights)[[beam_rows[position] for position in positions]] + masks
+		totals = local + np.array([[item.score] for item in beam])
+		ranking = np.lexsort((-local.ravel(), -totals.ravel()))[:beam_size] # lexsort is stable
+		ranking = [candidate for candidate in ranking.tolist() if totals.flat[candidate] > -np.inf]
+		
+		uses = [0] * len(beam) # the last candidate of an item takes over its state, the others copy it
+		for candidate in ranking:
+			uses[candidate // 4] += 1
+		next_beam = []
+		for candidate in ranking:
+			position, tr_code = divmod(candidate, 4)
+			item = beam[position]
+			if not item.state.queue: #finished
+				next_beam.append(item)
+				continue
+			uses[position] -= 1
+			current_state = item.state if uses[position] == 0 else item.state.copy()
+			current_state = Transition(tr_code).apply_transition(current_state)
+			gold = item.gold and tr_code == gold_transitions[step]
+			next_beam.append(BeamItem(float(totals[position, tr_code]), current_state, (item.history, fvectors[beam_rows[position]], tr_code), gold))
+		
+		if gold_transitions is not None and not any(item.gold for item in next_beam): #early update
+			position = [item.gold for item in beam].index(True)
+			item = beam[position]
+			if item.state.queue: #the gold item of this step, its state is not needed for the update
+				tr_code = gold_transitions[step]
+				item = BeamItem(float(totals[position, tr_code]), None, (item.history, fvectors[beam_rows[position]], tr_code), True)
+			return next_beam[0], item
+		beam = next_beam
+		step += 1
+	
+	gold_items = [item for item in beam if item.gold]
+	return beam[0], gold_items[0] if gold_items else None
+
+def parse_beam(current_sentence, feats, guide, beam_size):
+	'''parse a sentence with the beam decoder and store the heads of the best final state in it'''
+	best = beam_search(current_sentence, feats, guide, beam_size)[0]
+	attach_heads(current_sentence, best.state)
+	return current_sentence
 
-def get_dependents(token, arcs):
-	return  [tup[1] for tup in arcs if tup[0] == token]	 #get a list of children from arcs where head = token ID
+def parse_batch(sentences, feats, guide, batch_size):
+	'''greedily parse the sentences in lockstep, batch_size of them at a time, and yield them in input order'''
+	# every step scores the configurations of all active sentences with one call to predict_transitions, finished
+	# sentences leave the batch and the next sentences of the input take their place
+	pending = iter(sentences)
+	active = [] # (sentence, state) pairs
+	window = deque() # sentences taken from the input and not yielded yet, in input order
+	finished = set() # ids of the parsed sentences in window
+	while True:
+		while len(active) < batch_size:
+			current_sentence = next(pending, None)
+			if current_sentence is None:
+				break
+			active.append((current_sentence, State(len(current_sentence.forms))))
+			window.append(current_sentence)
+		if not active:
+			break
+		
+		fvectors = [feats.extract_features(current_state, current_sentence) for current_sentence, current_state in active]
+		legal_transitions = [guide.get_legal_transitions(current_state) for current_sentence, current_state in active]
+		predictions = guide.predict_transitions(fvectors, feats.weights, legal_transitions)
+		
+		still_active = []
+		for (current_sentence, current_state), tr_code in zip(active, predictions):
+			current_state = Transition(tr_code).apply_transition(current_state)
+			if current_state.queue:
+				still_active.append((current_sentence, current_state))
+			else:
+				attach_heads(current_sentence, current_state)
+				finished.add(id(current_sentence))
+		active = still_active
+		
+		while window and id(window[0]) in finished: #short sentences wait for the longer ones before them
+			finished.remove(id(window[0]))
+			yield window.popleft()
+
+def attach_heads(current_sentence, current_state):
+	'''store the heads of a final state in the sentence, headless tokens get a neighbor as their head'''
+	#loop through tokens of a sentence (skip root and start with 1)	
+	for index in range (1, len(current_sentence.forms)):
+		head = current_state.heads[index]
+		if head == -1: 
+			if index == 1:
+				head = index + 1 #assign right neighbor as head for 1st token
+			else:	
+				head = index - 1 #use the left neighbor as a default head
+		current_sentence.heads[index] = head
+
+def parse_serial(sentences, feats, guide, batch_size = 1, beam_size = 1, static_scores = False):
+	'''parse sentences in this process, one at a time or in lockstep batches, and yield them in input order'''
+	if beam_size > 1: #the beam decoder parses one sentence at a time and scores the full feature vectors
+		return (parse_beam(current_sentence, feats, guide, beam_size) for current_sentence in sentences)
+	if batch_size > 1: #the batch decoder scores the full feature vectors, static scores are not used
+		return parse_batch(sentences, feats, guide, batch_size)
+	return (parse_sentence(current_sentence, feats, guide, static_scores) for current_sentence in sentences)
+
+def parse_chunk(chunk):
+	'''parse a chunk of sentences in a worker process with the model of parse_job and return their heads'''
+	feats, guide, batch_size, beam_size, static_scores = parse_job
+	heads = [current_sentence.heads for current_sentence in parse_serial(chunk, feats, guide, batch_size, beam_size, static_scores)]
+	trim_atoms() # between two chunks no sentence of the worker holds on to its atoms
+	return heads
+
+def parse_stream(sentences, feats, guide, workers = 1, batch_size = 1, beam_size = 1, static_scores = False):
+	'''parse sentences from any iterable and yield each one as soon as it and all sentences before it are parsed'''
+	global parse_job, active_parses
+	if workers <= 1:
+		# every new word is interned, so a long stream drops its atoms now and then to run in bounded memory
+		with atom_lock:
+			active_parses += 1
+		try:
+			for current_sentence in parse_serial(sentences, feats, guide, batch_size, beam_size, static_scores):
+				yield current_sentence
+				trim_atoms(True)
+		finally:
+			with atom_lock:
+				active_parses -= 1
+		return
+	
+	# the workers are forked after the model is loaded and find it in parse_job, so the weight matrix and the
+	# feature map are shared copy-on-write instead of being pickled to every worker, only the sentences of a
+	# chunk go to a worker and only the predicted heads come back
+	parse_job = (feats, guide, batch_size, beam_size, static_scores)
+	if static_scores: #the workers share the copy of the weight rows too, only their static score rows are their own
+		feats.reserve_static_rows(STATIC_ROWS)
+	pool = multiprocessing.Pool(workers)
+	pending = deque() # (chunk, result) in input order, at most 2 chunks per worker are read ahead
+	try:
+		sentences = iter(sentences)
+		chunks = iter(lambda: list(islice(sentences, PARSE_CHUNK_SIZE)), [])
+		for chunk in chain(chunks, [None]):
+			if chunk is not None:
+				pending.append((chunk, pool.apply_async(parse_chunk, (chunk,))))
+			while pending and (chunk is None or len(pending) > 2 * workers):
+				chunk_sentences, result = pending.popleft()
+				for current_sentence, sentence_heads in zip(chunk_sentences, result.get()):
+					current_sentence.heads = sentence_heads
+					yield current_sentence
+	finally:
+		pool.terminate()
+		pool.join()
+		parse_job = None
+
+def parse_sentences(sentences, feats, guide, workers = 1, batch_size = 1, beam_size = 1, static_scores = False):
+	'''parse a list of sentences and store the predicted heads in them'''
+	for current_sentence in parse_stream(sentences, feats, guide, workers, batch_size, beam_size, static_scores):
+		pass
+	return sentences
+
+def build_corpus(input_file):
+	'''read an open CoNLL06 file into a Corpus'''
+	# the strings of every column are interned in the order they first occur, after the string of the root token
+	vocabularies = dict((name, {root: 0}) for name, position, root in CORPUS_COLUMNS)
+	columns = dict((name, array('i')) for name, position, root in CORPUS_COLUMNS)
+	heads = array('i')
+	offsets = array('l', [0]) # see get_int64_array
+	for line_no, line in enumerate(input_file, 1):
+		if not line.strip(): #empty line that seperates sentences
+			if len(heads) > offsets[-1]:
+				offsets.append(len(heads))
+			continue
+		token = line.split("\t")
+		if len(token) < 8: #the columns are read up to the relation, like in read_conll
+			raise ValueError("line %i is not a CoNLL06 token line, it has %i of the 10 tab-separated columns" %(line_no, len(token)))
+		#token Id = 1 --> new sentence, even if the blank line before it is missing
+		if token[0] == "1" and len(heads) > offsets[-1]:
+			offsets.append(len(heads))
+		for name, position, root in CORPUS_COLUMNS:
+			vocabulary = vocabularies[name]
+			string = token[position]
+			string_id = vocabulary.get(string)
+			if string_id is None:
+				string_id = vocabulary[string] = len(vocabulary)
+			columns[name].append(string_id)
+		heads.append(int(token[6]) if token[6] != "_" else -1)
+	if len(heads) > offsets[-1]: #the last sentence of a file without a trailing blank line
+		offsets.append(len(heads))
+	
+	strings = {}
+	for name, position, root in CORPUS_COLUMNS:
+		strings[name] = [None] * len(vocabularies[name])
+		for string, string_id in vocabularies[name].iteritems():
+			strings[name][string_id] = string
+		columns[name] = np.frombuffer(columns[name], dtype=np.int32)
+	return Corpus(strings, columns, np.frombuffer(heads, dtype=np.int32), get_int64_array(offsets))
+
+def load_corpus(cache_file, source_file):
+	'''load a Corpus from its cache, returns None if the cache is missing or out of date'''
+	if not os.path.exists(cache_file):
+		return None
+	with open(cache_file, 'rb') as fp:
+		cache = pickle.load(fp)
+	if cache["version"] != CORPUS_VERSION or cache["source"] != get_source_key(source_file):
+		return None
+	return Corpus(cache["vocabularies"], cache["columns"], cache["heads"], cache["offsets"])
+
+def read_corpus(source_file):
+	'''return the Corpus of a CoNLL06 file from the cache next to it (<file>.corpus), building the cache if it is missing or out of date'''
+	cache_file = source_file + ".corpus"
+	corpus = load_corpus(cache_file, source_file)
+	if corpus is None:
+		with open(source_file, 'rb') as input_file:
+			corpus = build_corpus(input_file)
+		try:
+			corpus.save(cache_file, source_file)
+		except (IOError, OSError): #read-only directory, the corpus is built again next time
+			pass
+	return corpus
+
+def read_conll(input_file, training = True):
+	'''read sentences from an open CoNLL06 file and yield them one at a time'''
+	current_sentence = None
+	for line_no, line in enumerate(input_file, 1):
+		if not line.strip(): #empty line that seperates sentences
+			if current_sentence is not None:
+				yield current_sentence
+				current_sentence = None
+			continue
+		
+		current_line = line.split("\t")
+		if len(current_line) < 8: #add_token reads the columns up to the relation
+			raise ValueError("line %i is not a CoNLL06 token line, it has %i of the 10 tab-separated columns" %(line_no, len(current_line)))
+		#token Id = 1 --> new sentence, even if the blank line before it is missing
+		if current_line[0] == "1" and current_sentence is not None:
+			yield current_sentence
+			current_sentence = None
+		if current_sentence is None:
+			current_sentence = Sentence()
+		current_sentence.add_token(current_line, training)
+	
+	if current_sentence is not None: #the last sentence of a file without a trailing blank line
+		yield current_sentence
 
-def get_head(token, arcs):
-	return  [tup[0] for tup in arcs if tup[1] == token]	 #get a list of heads from arcs where child = token ID
+def format_sentence(current_sentence):
+	'''return the CoNLL06 lines of a parsed sentence with the blank line that ends it'''
+	#loop through tokens of a sentence (skip root and start with 1)
+	lines = ["%i\t%s\t%s\t%s\t_\t%s\t%i\t%s\t_\t_\n" \
+		%(index,current_sentence.forms[index],current_sentence.lemmas[index],current_sentence.pos[index],current_sentence.morphs[index],current_sentence.heads[index],current_sentence.relations[index])
+		for index in range(1, len(current_sentence.forms))]
+	lines.append("\n") #"\n" after each sentence to seperate sentences
+	return "".join(lines)
 
+def write_conll(output_file, sentences, flush = False):
+	'''write parsed sentences to an open file as they come in, one write call per sentence'''
+	for current_sentence in sentences:
+		output_file.write(format_sentence(current_sentence))
+		if flush: #let a reader at the other end of a pipe see every sentence right away
+			output_file.flush()
@@ -0,0 +1,103 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script sends CoNLL06 sentences to a running parse server (server.py) and prints the parsed sentences.
+
+usage: python client.py [en|de] [--port <n> | --socket <path>] [--input <file>]
+
+The sentences are read from stdin unless an input file is given, the parsed sentences go to stdout. If the
+server can not parse the request, its error message goes to stderr and the client exits with status 1.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+import socket
+import threading
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def connect(port = 8642, socket_path = None):
+	'''open a connection to the parse server on a unix socket or on a localhost tcp port'''
+	if socket_path:
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.connect(socket_path)
+	else:
+		connection = socket.create_connection(("localhost", port))
+	return connection
+
+def send_request(connection, language, conll):
+	'''send the language and the CoNLL06 text of a request and close the sending side of the connection'''
+	try:
+		connection.sendall("%s\n" % language)
+		connection.sendall(conll)
+		connection.shutdown(socket.SHUT_WR) # end of the request
+	except socket.error: #the server closed the connection early, its answer says why
+		pass
+
+def request_parse(connection, language, conll):
+	'''send the CoNLL06 text of a request and yield the parsed sentences as they come back'''
+	# the server answers while the request is still coming in, so the request is sent from another thread, with
+	# both sides writing and nobody reading the socket buffers of a large request would fill up and block
+	sender = threading.Thread(target=send_request, args=(connection, language, conll))
+	sender.daemon = True
+	sender.start()
+	response = connection.makefile('rb')
+	lines = []
+	for line in response:
+		if line.startswith("ERROR"):
+			raise IOError(line.strip())
+		lines.append(line)
+		if line == "\n": #blank line at the end of every sentence
+			yield "".join(lines)
+			lines = []
+	if lines: #the connection was closed in the middle of a sentence
+		raise IOError("ERROR the answer of the server ended in the middle of a sentence")
+	sender.join()
+	response.close()
+	connection.close()
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+if __name__ == "__main__":
+	language = "english"
+	port = 8642
+	socket_path = None
+	input_path = None
+
+	for i, arg in enumerate(sys.argv):
+		if str(arg).lower() == "de":
+			language = "german"
+		elif arg == "--port":
+			port = int(sys.argv[i + 1])
+		elif arg == "--socket":
+			socket_path = sys.argv[i + 1]
+		elif arg == "--input":
+			input_path = sys.argv[i + 1]
+
+	if input_path:
+		with open(input_path, 'rb') as input_file:
+			conll = input_file.read()
+	else:
+		conll = sys.stdin.read()
+
+	try:
+		for parsed_sentence in request_parse(connect(port, socket_path), language, conll):
+			sys.stdout.write(parsed_sentence)
+			sys.stdout.flush()
+	except IOError as exc: #an ERROR answer of the server or a failed connection
+		print >> sys.stderr, exc
+		sys.exit(1)
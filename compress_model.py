@@ -0,0 +1,85 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script shrinks a trained model (model-<lang>) by dropping features and storing the weights with fewer bits.
+
+usage: python compress_model.py [en|de] [--min-weight <x>] [--min-count <n>] [--quantize float16|int8] [--output <file>]
+
+	--min-weight <x>   drop the features whose 4 weights are all within x of zero (default 0, which only drops
+	                   the all-zero rows and leaves the predictions exactly as they are)
+	--min-count <n>    drop the features that occur in fewer than n training instances, the counts come from the
+	                   instance cache trainer.py left next to the training file
+	--quantize <fmt>   store the weights as float16 or as int8 with one scale for the whole matrix
+	--output <file>    write the compressed model to this file instead of replacing model-<lang>
+
+The parser loads compressed models like any other model, quantized weights are expanded to float64 on loading.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+import os
+from classes import *
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+language= "english"
+train_file = "./data/english/train/wsj_train.only-projective.conll06"
+min_weight = 0.0
+min_count = 0
+weight_format = "float64"
+output_path = None
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+for i, arg in enumerate(sys.argv):
+	if str(arg).lower() == "de":
+		language = "german"
+		train_file = "./data/german/train/tiger-2.2.train.only-projective.conll06"
+	elif arg == "--min-weight":
+		min_weight = float(sys.argv[i + 1])
+	elif arg == "--min-count":
+		min_count = int(sys.argv[i + 1])
+	elif arg == "--quantize":
+		weight_format = sys.argv[i + 1]
+	elif arg == "--output":
+		output_path = sys.argv[i + 1]
+
+model_file = "model-%s" % language
+output_path = output_path or model_file
+print "Compressing %s (%.1f MB)..." %(model_file, os.path.getsize(model_file) / 1e6)
+feats = Features()
+feats.load_model(language)
+n_features = feats.next_index
+
+counts = None
+if min_count > 1:
+	# the instances of the cache use the weight rows of the model trained from it
+	cached = Features()
+	if not cached.load_instances(train_file + ".instances", train_file) or cached.next_index != n_features:
+		print "No instance cache of %s that matches the model, run trainer.py first to count the features" %train_file
+		sys.exit(1)
+	counts = np.bincount(cached.instances.freeze().features, minlength=n_features)
+	cached = None
+
+if feats.hash_bits: #the rows of a hashed table can not be renumbered
+	if min_weight or min_count > 1:
+		print "Hashed models can not be pruned, only quantized"
+		sys.exit(1)
+	dropped = 0
+else:
+	dropped = feats.prune(min_weight, counts, min_count)
+feats.save_model(language, output_path, weight_format)
+print "Dropped %i of %i features, wrote %s with %s weights (%.1f MB)" %(dropped, n_features, output_path, weight_format, os.path.getsize(output_path) / 1e6)
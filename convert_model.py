@@ -0,0 +1,42 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script converts a model saved in the old pickle format (feature-map-<lang> and weights-<lang>)
+to the binary model file (model-<lang>) that the parser memory-maps.
+
+usage: python convert_model.py [en|de]
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+from classes import *
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+language= "english"
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+for arg in sys.argv:
+	if str(arg).lower() == "de":
+		language = "german"
+
+print "Converting the pickled %s model..." %language
+feats = Features()
+feats.load_mapping(language)
+feats.load_weights(language)
+feats.save_model(language)
+print "Wrote model-%s (%i features, %i weight rows)" %(language, len(feats.mapping), len(feats.weights))
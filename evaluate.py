@@ -0,0 +1,103 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script scores the predictions of the parser against a gold CoNLL06 file.
+
+usage: python evaluate.py [en|de] [--gold <file>] [--prediction <file>] [--labeled]
+
+	--gold <file>        gold file (default: the dev gold file of the language)
+	--prediction <file>  predicted file (default: prediction-<lang>.conll06)
+	--labeled            also report the LAS, for predictions whose relations were assigned by a labeler
+
+The unlabeled attachment score (UAS) is the share of tokens with the gold head. The labeled attachment score (LAS)
+also needs the gold relation. It is only reported with --labeled: parser.py does not predict relations, it copies
+the relation column of its input, so the relations of its predictions say nothing about the parser.
+Both files are read into arrays of heads and relation ids (see read_corpus) and compared as whole arrays.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+from itertools import chain
+import numpy as np
+from classes import build_corpus, read_corpus
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def get_heads(sentences, gold = False):
+	'''return the predicted (or gold) heads of all tokens of sentences as one array, without the root tokens'''
+	name = "gold_heads" if gold else "heads"
+	return np.fromiter(chain.from_iterable(getattr(current_sentence, name)[1:] for current_sentence in sentences), dtype=np.int32)
+
+def attachment_score(gold_heads, predicted_heads):
+	'''return the share of tokens with the gold head in percent'''
+	if len(gold_heads) != len(predicted_heads):
+		raise ValueError("%i gold tokens but %i predicted tokens" % (len(gold_heads), len(predicted_heads)))
+	return 100.0 * np.count_nonzero(gold_heads == predicted_heads) / max(len(gold_heads), 1)
+
+def evaluate_corpora(gold, predicted, labeled = False):
+	'''compare the heads (and with labeled the relations) of two corpora, returns the number of tokens, the UAS and the LAS (None if not labeled or without predicted relations)'''
+	uas = attachment_score(gold.heads, predicted.heads) # checks that both have the same number of tokens
+	las = None
+	relations = predicted.vocabularies["relations"]
+	if labeled and set(relations[1:]) - set(["_"]): #the relation ids of the two files are mapped through their strings
+		gold_ids = dict((relation, relation_id) for relation_id, relation in enumerate(gold.vocabularies["relations"]))
+		relation_map = np.array([gold_ids.get(relation, -1) for relation in relations], dtype=np.int32)
+		correct_relations = gold.columns["relations"] == relation_map[predicted.columns["relations"]]
+		las = 100.0 * np.count_nonzero((gold.heads == predicted.heads) & correct_relations) / max(len(gold.heads), 1)
+	return {"tokens": len(gold.heads), "uas": uas, "las": las}
+
+def evaluate_files(gold_file, predicted_file, labeled = False):
+	'''score a predicted CoNLL06 file against a gold file, see evaluate_corpora'''
+	gold = read_corpus(gold_file)
+	with open(predicted_file, 'rb') as input_file: #predictions change with every run, they are not cached
+		predicted = build_corpus(input_file)
+	return evaluate_corpora(gold, predicted, labeled)
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+if __name__ == "__main__":
+	language = "english"
+	gold_path = None
+	prediction_path = None
+	labeled = False
+
+	for i, arg in enumerate(sys.argv):
+		if str(arg).lower() == "de":
+			language = "german"
+		elif arg == "--gold":
+			gold_path = sys.argv[i + 1]
+		elif arg == "--prediction":
+			prediction_path = sys.argv[i + 1]
+		elif arg == "--labeled":
+			labeled = True
+
+	if gold_path is None:
+		gold_path = {"english": "./data/english/dev/wsj_dev.conll06.gold", "german": "./data/german/dev/tiger-2.2.dev.conll06.gold"}[language]
+	if prediction_path is None:
+		prediction_path = "prediction-%s.conll06" % language
+
+	try:
+		scores = evaluate_files(gold_path, prediction_path, labeled)
+	except ValueError as exc: #the files do not have the same tokens
+		print "Can not score %s against %s: %s" % (prediction_path, gold_path, exc)
+		sys.exit(1)
+	print "tokens: %i" % scores["tokens"]
+	print "UAS: %.2f" % scores["uas"]
+	if labeled and scores["las"] is None:
+		print "LAS: - (the predictions have no relations)"
+	elif labeled:
+		print "LAS: %.2f" % scores["las"]
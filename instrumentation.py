@@ -0,0 +1,208 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script records where the time of a training or parsing run goes and writes it as a JSON report.
+
+The report holds the time and peak memory of every phase, the instances/sec and mistake rate of every training
+epoch, the parse speed, the share of features of the parsed sentences that are missing from the frozen feature
+map and the parse time of sentences of different lengths. A cProfile dump of the whole run can be written too.
+
+A disabled Instrumentation only checks a flag at the start and end of phases and epochs, the feature lookups
+and the parsed sentences are only wrapped when it is enabled. The feature misses can only be counted when the
+features are looked up in this process, otherwise the report marks them as unavailable with the reason.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import json
+import platform
+import resource
+import time
+from contextlib import contextmanager
+
+'''
+******* ********* *********
+******* constants *********
+******* ********* *********
+'''
+LENGTH_BUCKET_SIZE = 10 # sentence lengths are grouped into 1-10, 11-20, ... tokens
+LAST_LENGTH_BUCKET = 60 # sentences of 61 tokens and more share the last bucket
+
+'''
+******* ********* *********
+*******  Classes  *********
+******* ********* *********
+'''
+
+class Instrumentation:
+	'Collects timings and counts of a training or parsing run and writes them as a JSON report'
+	def __init__(self, enabled = True, profile_file = None):
+		self.enabled = enabled
+		self.profile_file = profile_file # cProfile dump of the whole run, None = no profiling
+		self.profiler = None
+		self.info = {} # settings of the run (language, workers, ...)
+		self.phases = []
+		self.epochs = []
+		self.parse = None
+		self.feature_lookups = 0
+		self.feature_keys = 0
+		self.feature_misses = 0
+		self.features_unavailable = None # why the feature misses of the run can not be counted, None = they are counted
+		self.lengths = {} # length bucket -> [sentences, tokens, seconds]
+		self.watched_feats = None
+		self.start_time = time.time()
+
+	def start(self):
+		'''method to start the profiler if a profile file is given'''
+		if self.enabled and self.profile_file:
+			import cProfile # only loaded when profiling
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+
+	@contextmanager
+	def phase(self, name):
+		'''method to time a phase of the run and record its peak memory'''
+		if not self.enabled:
+			yield
+			return
+		reset_peak_rss()
+		start = time.time()
+		yield
+		self.phases.append({"name": name, "seconds": time.time() - start, "peak_rss_mb": get_peak_rss() / 1e6})
+
+	def record_epoch(self, epoch, seconds, instances, mistakes):
+		'''method to record the speed and the mistake rate of a training epoch'''
+		if not self.enabled:
+			return
+		self.epochs.append({"epoch": epoch, "seconds": seconds, "instances": instances,
+			"instances_per_sec": instances / seconds if seconds else None,
+			"mistakes": mistakes, "mistake_rate": float(mistakes) / instances if instances else None})
+
+	def record_dev(self, score, seconds):
+		'''method to add the dev score of the averaged weights and the time it took to the last recorded epoch'''
+		if not self.enabled or not self.epochs:
+			return
+		self.epochs[-1].update(dev_uas=score, dev_seconds=seconds)
+
+	def watch_features(self, feats):
+		'''method to count the features that are missing from the frozen feature map of a model while it parses'''
+		if not self.enabled:
+			return
+		lookup_features = feats.lookup_features
+		def counting_lookup(keys):
+			fvector = lookup_features(keys)
+			self.feature_lookups += 1
+			self.feature_keys += len(keys)
+			self.feature_misses += len(keys) - len(fvector) # unseen features are dropped from the vector
+			return fvector
+		feats.lookup_features = counting_lookup # shadows the method on this model only
+		self.watched_feats = feats
+
+	def skip_features(self, reason):
+		'''method to report the feature misses as unavailable instead of counting a part of them'''
+		if not self.enabled:
+			return
+		self.features_unavailable = reason
+
+	def time_sentences(self, sentences, per_sentence = True):
+		'''method to wrap the parsed sentences of a run and time them, one by one if per_sentence is True'''
+		if not self.enabled:
+			return sentences
+		return self.timed_sentences(sentences, per_sentence)
+
+	def timed_sentences(self, sentences, per_sentence):
+		'''yield the parsed sentences and record the parse speed and the time of every sentence by its length'''
+		# the time of a sentence is the time between two sentences coming out of the parser, which only matches
+		# its parse time when the sentences are parsed one at a time in this process
+		count = 0
+		tokens = 0
+		seconds = 0.0
+		last = time.time()
+		for current_sentence in sentences:
+			elapsed = time.time() - last
+			length = len(current_sentence.forms) - 1
+			count += 1
+			tokens += length
+			seconds += elapsed
+			if per_sentence:
+				bucket = self.lengths.setdefault(min((length - 1) // LENGTH_BUCKET_SIZE, LAST_LENGTH_BUCKET // LENGTH_BUCKET_SIZE), [0, 0, 0.0])
+				bucket[0] += 1
+				bucket[1] += length
+				bucket[2] += elapsed
+			yield current_sentence
+			last = time.time() # the time spent writing the sentence is not counted
+		self.parse = {"sentences": count, "tokens": tokens, "seconds": seconds,
+			"tokens_per_sec": tokens / seconds if seconds else None,
+			"sentences_per_sec": count / seconds if seconds else None}
+
+	def get_report(self):
+		'''method to return the report as a dict'''
+		report = {"info": self.info, "python": platform.python_version(),
+			"seconds": time.time() - self.start_time, "phases": self.phases,
+			"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3}
+		if self.epochs:
+			report["epochs"] = self.epochs
+		if self.parse is not None:
+			report["parse"] = self.parse
+		if self.features_unavailable is not None:
+			report["features"] = {"miss_rate": None, "unavailable": self.features_unavailable}
+		elif self.feature_lookups:
+			report["features"] = {"lookups": self.feature_lookups, "keys": self.feature_keys, "misses": self.feature_misses,
+				"miss_rate": float(self.feature_misses) / self.feature_keys}
+		if self.lengths:
+			report["sentence_lengths"] = [{"lengths": get_length_label(bucket), "sentences": count, "tokens": tokens, "seconds": seconds,
+				"msec_per_sentence": 1000 * seconds / count, "tokens_per_sec": tokens / seconds if seconds else None}
+				for bucket, (count, tokens, seconds) in sorted(self.lengths.items())]
+		return report
+
+	def finish(self, report_file):
+		'''method to stop the profiler, write its dump and write the report to a JSON file'''
+		if not self.enabled:
+			return
+		if self.profiler is not None:
+			self.profiler.disable()
+			self.profiler.dump_stats(self.profile_file) # read it with: python -m pstats <file>
+			self.profiler = None
+		if self.watched_feats is not None:
+			del self.watched_feats.lookup_features # back to the method of the class
+			self.watched_feats = None
+		if report_file:
+			with open(report_file, 'w') as output_file:
+				json.dump(self.get_report(), output_file, indent=1, sort_keys=True)
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def get_length_label(bucket):
+	'''return the range of sentence lengths of a length bucket, like 11-20 or 61+'''
+	if LENGTH_BUCKET_SIZE * bucket >= LAST_LENGTH_BUCKET:
+		return "%i+" % (LENGTH_BUCKET_SIZE * bucket + 1)
+	return "%i-%i" % (LENGTH_BUCKET_SIZE * bucket + 1, LENGTH_BUCKET_SIZE * (bucket + 1))
+
+def reset_peak_rss():
+	'''start a new peak of the resident memory of this process (linux only, ignored elsewhere)'''
+	try:
+		with open("/proc/self/clear_refs", "w") as clear_refs:
+			clear_refs.write("5")
+	except (IOError, OSError):
+		pass
+
+def get_peak_rss():
+	'''return the peak resident memory of this process in bytes since the last reset_peak_rss'''
+	try:
+		with open("/proc/self/status") as status:
+			for line in status:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1]) * 1024
+	except (IOError, OSError):
+		pass
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # peak of the whole run
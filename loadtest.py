@@ -0,0 +1,107 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script sends concurrent requests to a running parse server (server.py) and reports latency and throughput.
+
+usage: python loadtest.py [en|de] [--port <n> | --socket <path>] [--clients <n>] [--requests <n>] [--sentences <n>]
+
+Every client sends --requests requests of --sentences consecutive sentences of the dev file one after another.
+The report gives the p50 and p99 latency of a request (until the last parsed sentence is back) and the
+sentences parsed per second over the whole run.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+import time
+import threading
+from client import connect, request_parse
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+language = "english"
+dev_file = "./data/english/dev/wsj_dev.conll06.blind"
+port = 8642
+socket_path = None
+clients = 4
+requests = 50
+sentences_per_request = 5
+latencies = [] #seconds per request of all clients
+errors = []
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def read_blocks(path):
+	'''read a CoNLL06 file into a list of sentence texts'''
+	with open(path, 'rb') as input_file:
+		return [block + "\n\n" for block in input_file.read().strip("\n").split("\n\n")]
+
+def percentile(values, share):
+	'''return the value below which the given share of the sorted values lies'''
+	values = sorted(values)
+	return values[min(len(values) - 1, int(share * len(values)))]
+
+def run_client(client_no, blocks):
+	'''send the requests of one client one after another and record their latencies'''
+	for k in range(requests):
+		start = (client_no * requests + k) * sentences_per_request % max(1, len(blocks) - sentences_per_request)
+		conll = "".join(blocks[start:start + sentences_per_request])
+		begin = time.time()
+		try:
+			parsed = list(request_parse(connect(port, socket_path), language, conll))
+			if len(parsed) != sentences_per_request:
+				raise IOError("%i sentences sent, %i parsed" % (sentences_per_request, len(parsed)))
+		except Exception as exc:
+			errors.append(exc)
+			continue
+		latencies.append(time.time() - begin)
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+for i, arg in enumerate(sys.argv):
+	if str(arg).lower() == "de":
+		language = "german"
+		dev_file = "./data/german/dev/tiger-2.2.dev.conll06.blind"
+	elif arg == "--port":
+		port = int(sys.argv[i + 1])
+	elif arg == "--socket":
+		socket_path = sys.argv[i + 1]
+	elif arg == "--clients":
+		clients = int(sys.argv[i + 1])
+	elif arg == "--requests":
+		requests = int(sys.argv[i + 1])
+	elif arg == "--sentences":
+		sentences_per_request = int(sys.argv[i + 1])
+
+blocks = read_blocks(dev_file)
+threads = [threading.Thread(target=run_client, args=(client_no, blocks)) for client_no in range(clients)]
+start = time.time()
+for thread in threads:
+	thread.start()
+for thread in threads:
+	thread.join()
+elapsed = time.time() - start
+
+print "%i clients x %i requests x %i sentences (%s)" %(clients, requests, sentences_per_request, language)
+if errors:
+	print "%i failed requests, first error: %s" %(len(errors), errors[0])
+if latencies:
+	print "p50 latency: %.1f ms" %(1000 * percentile(latencies, 0.50))
+	print "p99 latency: %.1f ms" %(1000 * percentile(latencies, 0.99))
+	print "throughput:  %.1f sentences/sec" %(len(latencies) * sentences_per_request / elapsed)
@@ -13,8 +13,9 @@ This script takes the pre-trained parser model and runs it on an unseen dataset.
 ******* ********* *********
 '''
 import sys
-from collections import deque
-from classes import *
+from api import Parser
+from classes import load_corpus, read_conll, read_corpus, write_conll
+from instrumentation import Instrumentation
 
 '''
 ******* ********* *********
@@ -25,7 +26,15 @@ language= "english"
 filename = "wsj_test.conll06.blind" # comment this to run on dev data
 #~ filename = "wsj_dev.conll06.blind" # uncomment this to run on dev data
 
-sentences = [] #create list to hold sentences 
+workers = 1 #number of parsing processes
+batch_size = 1 #number of sentences parsed in lockstep by each process
+beam_size = 1 #number of items of the beam decoder (1 = greedy decoding)
+static_scores = False #score the single-token templates once per sentence (same predictions)
+input_path = None #CoNLL06 file to parse instead of the test file of the language, "-" = stdin
+output_path = None #file to write the predictions to instead of prediction-<lang>.conll06, "-" = stdout
+cache_input = False #build the corpus cache of the input file (<file>.corpus) if it has none, instead of streaming the file
+report_path = None #JSON file of the timings, feature misses and sentence lengths of the run, None = no instrumentation
+profile_path = None #cProfile dump of the run, None = no profiling
 
 '''
 ******* ********* *********
@@ -36,92 +45,95 @@ sentences = [] #create list to hold sentences
 #******* Check parameters to pick language *********
 
 try:
-	
-	for arg in sys.argv:
+
+	for i, arg in enumerate(sys.argv):
 		if str(arg).lower() == "de":
 			language = "german"
 			filename = "tiger-2.2.test.conll06.blind" # comment this to run on dev data
 			#~ filename = "tiger-2.2.dev.conll06.blind" # uncomment this to run on dev data
+		elif arg == "--workers":
+			workers = int(sys.argv[i + 1])
+		elif arg == "--batch-size":
+			batch_size = int(sys.argv[i + 1])
+		elif arg == "--beam-size":
+			beam_size = int(sys.argv[i + 1])
+		elif arg == "--static-scores":
+			static_scores = True
+		elif arg == "--input":
+			input_path = sys.argv[i + 1]
+		elif arg == "--output":
+			output_path = sys.argv[i + 1]
+		elif arg == "--cache-input":
+			cache_input = True
+		elif arg == "--report":
+			report_path = sys.argv[i + 1]
+		elif arg == "--profile":
+			profile_path = sys.argv[i + 1]
 except Exception as exc:
 	language= "english"
 	filename = "wsj_test.conll06.blind" # comment this to run on dev data
 	#~ filename = "wsj_dev.conll06.blind" # uncomment this to run on dev data
-	print("An error occured while reading system paramters\n Using default language setting (en)\n error details: ", exc)	 
+	print("An error occured while reading system paramters\n Using default language setting (en)\n error details: ", exc)
 
-print "Parser using %s language files" %language
 path = "./data/%s/test/" %language # comment this to run on dev data
 #~ path = "./data/%s/dev/" %language # uncomment this to run on dev data
-prediction_file = "prediction-%s.conll06" %language
-
-print "Reading input data..."
-#******* Start acquire data *********
-
-#loop through rows
-with open(path+filename, 'rb') as input_file:
-	for line in input_file:
-		
-		if line == "\n":	#empty line that seperates sentences -> skip
-			continue
-			
-		current_line = line.split("\t")
-		#token Id = 1 --> new sentence was found, add it to list of sentences
-		if current_line[0] == "1":
-			sentences.append(Sentence())
-			
-		#add token information to current sentence || Training mode = False
-		sentences[len(sentences) - 1].add_token(current_line, False)
-	
-#******* End acquire data *********
-
-print "Loading trained model..."
-#******* load Model ********* 
-feats = Features()
-feats.frozen = True	
-feats.load_mapping(language)  
-feats.load_weights(language) 
- 
-guide = Guide()
-output_file= open(prediction_file ,"wb")
-#~ total_tokens = 0.0
-#~ headless_tokens = 0.0
-
-print "Parsing: extracting features and predicting heads..."
-#******* extract features and predict heads *********	
-for current_sentence in sentences: #[:50]
-	
-	current_state = State(len(current_sentence.forms)) # create a start state for the sentence
-	
-	while current_state.queue:
-		legal_transitions = guide.get_legal_transitions(current_state)
-		fvector = feats.extract_features(current_state, current_sentence) # extract featuress
-		tr_code = guide.predict_transition(fvector, feats.weights, legal_transitions)		
-		tr = Transition(tr_code)
-		current_state = tr.apply_transition(current_state) #create new state
-
-	 #final state reached, attach heads to healdess tokens.
-
-	#loop through tokens of a sentence (skip root and start with 1)	
-	for index in range (1, len(current_sentence.forms)):
-		#~ total_tokens += 1
-		# find head of current token inside the arcs of the final state
-		heads = [tup[0] for tup in current_state.arcs if tup[1] == index]
-		if len(heads) == 0: 
-			#~ headless_tokens += 1
-			if index == 1:
-				heads = [index + 1] #assign right neighbor as head for 1st token
-			else:	
-				heads = [index - 1] #use the left neighbor as a default head
-		current_sentence.heads[index] = heads[0]
-		token = "%i\t%s\t%s\t%s\t_\t%s\t%i\t%s\t_\t_\n"	\
-		%(index,current_sentence.forms[index],current_sentence.lemmas[index],current_sentence.pos[index],current_sentence.morphs[index],current_sentence.heads[index],current_sentence.relations[index])
-		#write token to file
-		output_file.write(token)					
-	
-	#write "\n" after each sentence to seperate sentences
-	output_file.write("\n")
-
-#close file
-output_file.close		
-
-#~ print "Headless tokens: %f " %(100.0 *(headless_tokens/total_tokens))
-print "done"
+if input_path is None:
+	input_path = path + filename
+if output_path is None:
+	output_path = "prediction-%s.conll06" %language
+log = sys.stderr if output_path == "-" else sys.stdout #keep the progress messages out of piped predictions
+
+print >> log, "Parser using %s language files" %language
+if static_scores and batch_size > 1:
+	print >> log, "Note: --static-scores is not used by the batch decoder (--batch-size > 1)"
+if beam_size > 1 and (static_scores or batch_size > 1):
+	print >> log, "Note: the beam decoder (--beam-size > 1) parses one sentence at a time without static scores"
+
+#******* read, parse and write one sentence at a time *********
+# sentences are read lazily and every parsed sentence is written right away, so memory does not grow with the input
+parser = Parser.load(language) # model-<lang> is memory-mapped on the first parse
+output_file = sys.stdout if output_path == "-" else open(output_path, "wb")
+input_file = None
+
+instrumentation = Instrumentation(bool(report_path or profile_path), profile_path)
+instrumentation.info = {"script": "parser", "language": language, "input_file": input_path, "workers": workers,
+	"batch_size": batch_size, "beam_size": beam_size, "static_scores": static_scores, "cache_input": cache_input}
+instrumentation.start()
+
+print >> log, "Loading trained model..."
+with instrumentation.phase("load_model"):
+	model = parser.get_model()
+if workers > 1: #the lookups of the worker processes never reach the counters of this process
+	instrumentation.skip_features("the sentences are parsed in %i worker processes (--workers)" %workers)
+elif static_scores and batch_size <= 1 and beam_size <= 1: #the single-token features are looked up without lookup_features
+	instrumentation.skip_features("the single-token features are scored once per sentence (--static-scores)")
+else:
+	instrumentation.watch_features(model)
+
+print >> log, "Parsing: reading sentences, extracting features and predicting heads..."
+with instrumentation.phase("parse"):
+	if input_path == "-":
+		sentences = read_conll(sys.stdin, False) # Training mode = False
+	else: #the sentences of a file with a corpus cache (<file>.corpus) are views of its arrays, other files are streamed
+		sentences = load_corpus(input_path + ".corpus", input_path) # None = no cache or an out of date one
+		if sentences is None and cache_input:
+			sentences = read_corpus(input_path) # reads the whole file and writes the cache
+		if sentences is None:
+			input_file = open(input_path, "rb")
+			sentences = read_conll(input_file, False)
+	parsed_sentences = parser.parse(sentences, workers, batch_size, beam_size, static_scores)
+	# the time of single sentences is only known when they are parsed one at a time in this process
+	parsed_sentences = instrumentation.time_sentences(parsed_sentences, workers <= 1 and (batch_size <= 1 or beam_size > 1))
+	write_conll(output_file, parsed_sentences, output_path == "-")
+
+#close files
+if input_file is not None:
+	input_file.close()
+if output_file is not sys.stdout:
+	output_file.close()
+
+instrumentation.finish(report_path)
+if report_path:
+	print >> log, "Report written to %s" %report_path
+
+print >> log, "done"
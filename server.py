@@ -0,0 +1,151 @@
+'''
+@author: Reem Alatrash
+@version: 1.0
+=======================
+
+This script keeps trained models in memory and parses CoNLL06 sentences sent over a local socket.
+
+usage: python server.py [en] [de] [--port <n> | --socket <path>] [--workers <n>]
+
+A request is the language (english or german) on the first line followed by CoNLL06 sentences, the client
+then closes its side of the connection. The server sends every sentence back with its predicted heads as
+soon as it and the sentences before it are parsed (see client.py). A request that can not be read or parsed
+is answered with a line "ERROR <message>" after the sentences parsed so far.
+
+'''
+
+'''
+******* ********* *********
+*******  imports  *********
+******* ********* *********
+'''
+import sys
+import os
+import socket
+import SocketServer
+from collections import deque
+from itertools import chain, islice
+from classes import *
+from api import get_model
+
+'''
+******* ********* *********
+******* constants *********
+******* ********* *********
+'''
+REQUEST_CHUNK_SIZE = 8 # sentences per pool task, small so that short requests are spread over the workers too
+
+'''
+******* ********* *********
+******* variables *********
+******* ********* *********
+'''
+languages = [] #languages to load, english if none is given
+port = 8642
+socket_path = None #serve on a unix socket instead of tcp
+workers = multiprocessing.cpu_count() #parse processes, the connection threads only read and write
+models = {} #language -> Features, loaded before the worker pool is forked so the workers share them
+guide = Guide()
+pool = None
+
+'''
+******* ********* *********
+******* functions *********
+******* ********* *********
+'''
+
+def parse_request_chunk(task):
+	'''parse a chunk of the sentences of a request in a worker process and return their heads'''
+	language, chunk = task
+	heads = [current_sentence.heads for current_sentence in parse_serial(chunk, models[language], guide)]
+	trim_atoms() # every new word of a request is interned, the atoms are dropped between two chunks (see parse_chunk)
+	return heads
+
+class ParseHandler(SocketServer.StreamRequestHandler):
+	'Handles one request: reads the language and the sentences and streams back the parsed sentences'
+	def handle(self):
+		try:
+			self.parse_request()
+		except socket.error: #the client is gone, there is nobody to answer
+			pass
+		except Exception as exc: #malformed sentences or a failed parse, the client gets the reason instead of a cut-off answer
+			message = " ".join(str(exc).split()) or type(exc).__name__
+			print >> sys.stderr, "Request failed: %s" %message
+			try:
+				self.wfile.write("ERROR %s\n" % message)
+			except socket.error:
+				pass
+
+	def parse_request(self):
+		'''method to read the language and the sentences of the request and write back the parsed sentences'''
+		language = self.rfile.readline().strip().lower()
+		language = {"en": "english", "de": "german"}.get(language, language)
+		if language not in models:
+			self.wfile.write("ERROR no model for language '%s'\n" % language)
+			return
+
+		sentences = read_conll(self.rfile, False)
+		# send chunks of the request to the pool as they are read, at most 2 chunks per worker wait for their result
+		pending = deque() # (chunk, result) in request order
+		chunks = iter(lambda: list(islice(sentences, REQUEST_CHUNK_SIZE)), [])
+		for chunk in chain(chunks, [None]):
+			if chunk is not None:
+				pending.append((chunk, pool.apply_async(parse_request_chunk, ((language, chunk),))))
+			while pending and (chunk is None or len(pending) > 2 * workers or pending[0][1].ready()):
+				chunk_sentences, result = pending.popleft()
+				for current_sentence, sentence_heads in zip(chunk_sentences, result.get()):
+					current_sentence.heads = sentence_heads
+				write_conll(self.wfile, chunk_sentences, True)
+
+class ThreadingTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class ThreadingUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+'''
+******* ********* *********
+*******  script   *********
+******* ********* *********
+'''
+for i, arg in enumerate(sys.argv):
+	if str(arg).lower() in ["en", "de"]:
+		languages.append({"en": "english", "de": "german"}[str(arg).lower()])
+	elif arg == "--port":
+		port = int(sys.argv[i + 1])
+	elif arg == "--socket":
+		socket_path = sys.argv[i + 1]
+	elif arg == "--workers":
+		workers = int(sys.argv[i + 1])
+
+if workers < 1: #the sentences are always parsed in the worker processes, never in the connection threads
+	print "The server needs at least 1 worker process (--workers)"
+	sys.exit(1)
+
+for language in languages or ["english"]:
+	print "Loading %s model..." %language
+	models[language] = get_model(language) # memory-maps model-<lang>
+
+pool = multiprocessing.Pool(workers) # forked after the models are loaded
+
+if socket_path:
+	if os.path.exists(socket_path):
+		os.remove(socket_path)
+	server = ThreadingUnixServer(socket_path, ParseHandler)
+	print "Serving %s on %s with %i workers" %(", ".join(sorted(models)), socket_path, workers)
+else:
+	server = ThreadingTCPServer(("localhost", port), ParseHandler)
+	print "Serving %s on localhost:%i with %i workers" %(", ".join(sorted(models)), port, workers)
+sys.stdout.flush()
+
+try:
+	server.serve_forever()
+except KeyboardInterrupt:
+	print "Shutting down..."
+finally:
+	server.server_close()
+	pool.terminate()
+	pool.join()
+	if socket_path and os.path.exists(socket_path):
+		os.remove(socket_path)
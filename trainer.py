@@ -13,11 +13,9 @@ This script takes the pre-trained parser model and runs it on an unseen dataset.
 ******* ********* *********
 '''
 import sys
-from collections import deque
-import oracle
-from classes import *
-import numpy as np
-import random
+import os
+from api import Trainer, sample_sentences, DEV_EVERY
+from instrumentation import Instrumentation
 
 '''
 ******* ********* *********
@@ -26,7 +24,22 @@ import random
 '''
 language= "english"
 filename = "wsj_train.only-projective.conll06"
-sentences = [] #create list to hold sentences 
+hash_bits = None #number of bits of the hashed feature table (None = exact feature map)
+workers = 1 #number of training processes (more than 1 = iterative parameter mixing)
+report_path = None #JSON file of the timings of the phases and epochs of the run, None = no instrumentation
+profile_path = None #cProfile dump of the run, None = no profiling
+epochs = 10 #perceptron epochs over the instances
+update_path = None #CoNLL06 file of new sentences to continue training model-<lang> on, None = train from scratch
+extract_workers = 1 #number of processes that extract the training instances
+replay_share = 0.0 #share of the sentences of the training file that is trained on again together with the new ones
+dev = False #score the averaged weights on the dev file and keep the best epoch
+dev_every = DEV_EVERY #score the dev file after every n-th epoch (and after the last one)
+dev_sample = 0 #number of dev sentences that are scored (0 = all)
+patience = 2 #dev scores without a better one before training stops (0 = run all epochs)
+checkpoint_path = None #file the training state is written to after every epoch (default model-<lang>.checkpoint)
+checkpoints = True #write a checkpoint after every epoch
+resume = False #continue the interrupted run of the checkpoint file
+beam_size = 1 #number of items of the beam decoder trained with early updates (1 = training on the oracle instances)
 
 '''
 ******* ********* *********
@@ -38,102 +51,94 @@ sentences = [] #create list to hold sentences
 
 try:
 	
-	for arg in sys.argv:
+	for i, arg in enumerate(sys.argv):
 		if str(arg).lower() == "de":
 			language = "german"
 			filename = "tiger-2.2.train.only-projective.conll06"
+		elif arg == "--hash-bits":
+			hash_bits = int(sys.argv[i + 1])
+		elif arg == "--workers":
+			workers = int(sys.argv[i + 1])
+		elif arg == "--report":
+			report_path = sys.argv[i + 1]
+		elif arg == "--profile":
+			profile_path = sys.argv[i + 1]
+		elif arg == "--extract-workers":
+			extract_workers = int(sys.argv[i + 1])
+		elif arg == "--epochs":
+			epochs = int(sys.argv[i + 1])
+		elif arg == "--update":
+			update_path = sys.argv[i + 1]
+		elif arg == "--replay":
+			replay_share = float(sys.argv[i + 1])
+		elif arg == "--beam-size":
+			beam_size = int(sys.argv[i + 1])
+		elif arg == "--dev":
+			dev = True
+		elif arg == "--dev-every":
+			dev_every = int(sys.argv[i + 1])
+		elif arg == "--dev-sample":
+			dev_sample = int(sys.argv[i + 1])
+		elif arg == "--patience":
+			patience = int(sys.argv[i + 1])
+		elif arg == "--checkpoint":
+			checkpoint_path = sys.argv[i + 1]
+		elif arg == "--no-checkpoint":
+			checkpoints = False
+		elif arg == "--resume":
+			resume = True
 except Exception as exc:
 	language= "english"
 	filename = "wsj_train.only-projective.conll06"
 	print("An error occured while reading system paramters\n Using default language setting (en)\n error details: ", exc)	 
 
 print "Trainer using %s language files" %language
+if beam_size > 1 and workers > 1:
+	print "The beam training (--beam-size) runs in a single process, leave out --workers"
+	sys.exit(1)
+if dev_every < 1:
+	print "--dev-every has to be at least 1"
+	sys.exit(1)
 path = "./data/%s/train/" %language
-
-print "Reading input data..."
-#******* Start acquire data *********
-
-#loop through rows
-with open(path+filename, 'r') as input_file:
-	for line in input_file:
-		
-		if line == "\n":	#empty line that seperates sentences -> skip
-			continue
-			
-		current_line = line.split("\t")
-		# if token Id = 1 -> new sentence was found, add it to list of sentences
-		if current_line[0] == "1":
-			sentences.append(Sentence())
-			
-		#add token information to current sentence
-		sentences[len(sentences) - 1].add_token(current_line)
-	
-#******* End acquire data *********
-
-feats = Features()	
-
-print "Extracting features and creating instances..."
-#******* build feature map and instances *********	
-for current_sentence in sentences: #[:50]
-	
-	current_state = State(len(current_sentence.forms)) # create a start state for the sentence
-	
-	while current_state.queue:
-		tr = oracle.get_oracle_transition(current_state, current_sentence.gold_arcs) #get correct transition
-		fvector = feats.extract_features(current_state, current_sentence) # extract featuress				
-		new_instance = Instance(tr.transition, fvector) # create instance
-		feats.instances.append(new_instance)
-		current_state = tr.apply_transition(current_state) #create new state
-
-#******* offline training *********
-print "Offline training: creating zero weight matrices..."
-feats.frozen = True 		#freeze feature map
-feats.weights = [[0 for col in range(4)] for row in range(feats.next_index)] #create a zero weights matrix of size n * 4, where n is the length of the feature map
-guide = Guide()
-cache_weights = [[0 for col in range(4)] for row in range(feats.next_index)]
-steps = 0.0
-random.seed(333)
-
-print "Offline training: looping over instances..."
-for k in range (10):
-	total_guesses = 0.0
-	correct_guesses = 0.0
-	
-	print "epoch: %i started..." %k
-	if k > 0:
-		random.shuffle(feats.instances)
-
-	#loop over instances
-	for instance in feats.instances:
-		steps += 1
-		predicted_tr = guide.predict_transition(instance.fvector, feats.weights)
-		total_guesses +=1
-		if predicted_tr != instance.transition: #compare prediction to correct transition
-			guide.update_weights(instance, predicted_tr, feats.weights, cache_weights, steps) #update weights
-		#~ else:
-			#~ correct_guesses +=1
-		#~ if total_guesses%1000 == 0:
-			#~ accuracy = 100.0 * (correct_guesses/total_guesses)
-			#~ print "Total guesses: %i Accuracy: %f"	%(total_guesses, accuracy)
-
-print "Averaging weights..."
-#average weights using numPy arrays
-#steps +=1
-np_cache_weights = np.array(cache_weights) 
-avg_weights = np.array(feats.weights) 
-np_cache_weights *=  (1/steps)
-avg_weights = avg_weights - np_cache_weights
-
-feats.weights = avg_weights.tolist()
+if checkpoints and checkpoint_path is None:
+	checkpoint_path = "model-%s.checkpoint" %language
+dev_path = {"english": "./data/english/dev/wsj_dev.conll06.gold", "german": "./data/german/dev/tiger-2.2.dev.conll06.gold"}[language] if dev else None
+
+instrumentation = Instrumentation(bool(report_path or profile_path), profile_path)
+instrumentation.info = {"script": "trainer", "language": language, "train_file": path + filename, "workers": workers, "extract_workers": extract_workers, "hash_bits": hash_bits,
+	"epochs": epochs, "update_file": update_path, "replay": replay_share, "beam_size": beam_size,
+	"dev_file": dev_path, "dev_every": dev_every, "dev_sample": dev_sample, "patience": patience, "checkpoint_file": checkpoint_path if checkpoints else None, "resume": resume}
+instrumentation.start()
+
+if resume and not (checkpoints and os.path.exists(checkpoint_path)):
+	print "No checkpoint to resume from (%s)" %checkpoint_path
+	sys.exit(1)
+trainer = Trainer(hash_bits, workers, epochs, log=sys.stdout, instrumentation=instrumentation, extract_workers=extract_workers, beam_size=beam_size,
+	dev=dev_path, patience=patience or None, checkpoint_file=checkpoint_path if checkpoints else None, resume=resume, dev_every=dev_every, dev_sample=dev_sample or None)
+try:
+	if update_path:
+		print "Continuing training of model-%s on %s..." %(language, update_path)
+		replay = sample_sentences(path + filename, replay_share) if replay_share > 0 else None
+		trainer.update(update_path, language, replay=replay) # only the new (and replayed) sentences are trained on
+	else:
+		trainer.fit(path + filename) # uses the binary cache of the feature map and instances next to the training file
+except ValueError as exc:
+	if not resume:
+		raise
+	print "Can not resume: %s" %exc #the checkpoint belongs to another run
+	sys.exit(1)
 
 print "Saving trained model..."	
-#save weights and mapping
-feats.save_mapping(language)
-  
-feats.save_weights(language)
+#save weights and mapping to model-<lang>
+trainer.save(language)
 	
-#~ print "weights: %i" % len(feats.weights)
-#~ print "feature map: %i" % len(feats.mapping)
-#~ print "instances: %i" % len(feats.instances)
+instrumentation.info.update(instances=len(trainer.feats.instances), features=trainer.feats.next_index)
+instrumentation.finish(report_path)
+if report_path:
+	print "Report written to %s" %report_path
+
+#~ print "weights: %i" % len(trainer.feats.weights)
+#~ print "feature map: %i" % len(trainer.feats.mapping)
+#~ print "instances: %i" % len(trainer.feats.instances)
   
 print "done" 